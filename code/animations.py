@@ -0,0 +1,207 @@
+import struct
+
+import pygame
+from asset_cache import load_surfaces
+
+DEFAULT_FRAME_DURATION = 100  # ms, what browsers use for GIF frames with no (or a near-zero) delay
+
+_atlases = {}
+
+
+class GifAtlas:
+    # Every scaled frame of one animation packed side by side in a single surface;
+    # frames are subsurfaces of it, so any number of GifAnimations share the same pixels
+    def __init__(self, surface, frame_size, durations):
+        self.surface = surface
+        self.frame_size = frame_size
+        self.durations = durations
+        width, height = frame_size
+        self.rects = [pygame.Rect(i * width, 0, width, height) for i in range(len(durations))]
+        self.frames = [surface.subsurface(rect) for rect in self.rects]
+        self.total_duration = sum(durations)
+
+
+def load_gif_atlas(gif_path, size):
+    key = (gif_path, tuple(size))
+    atlas = _atlases.get(key)
+    if atlas is None:
+        surfaces, meta = load_surfaces(gif_path, f'gifatlas{size[0]}x{size[1]}', lambda: build_gif_atlas(gif_path, size))
+        atlas = _atlases[key] = GifAtlas(surfaces[0], tuple(size), meta['durations'])
+    return atlas
+
+
+def build_gif_atlas(gif_path, size):
+    width, height = size
+    if width <= 0 or height <= 0:
+        raise ValueError("Invalid frame size dimensions.")
+
+    frames = decode_animation(gif_path)
+    surface = pygame.Surface((width * len(frames), height), pygame.SRCALPHA)
+    durations = []
+    for i, (frame, duration) in enumerate(frames):
+        surface.blit(pygame.transform.scale(frame, size), (i * width, 0))
+        durations.append(duration if duration > 10 else DEFAULT_FRAME_DURATION)
+    return [surface.convert_alpha()], {'durations': durations}
+
+
+def decode_animation(gif_path):
+    # pygame-ce can decode animations natively; classic pygame only ever returns the first frame
+    if hasattr(pygame.image, 'load_animation'):
+        return pygame.image.load_animation(gif_path)
+    with open(gif_path, 'rb') as f:
+        return decode_gif(f.read())
+
+
+def lzw_decode(data, min_code_size, pixel_count):
+    clear_code = 1 << min_code_size
+    end_code = clear_code + 1
+    output = bytearray()
+
+    code_size = min_code_size + 1
+    table = [bytes((i,)) for i in range(clear_code)] + [b'', b'']
+    previous = None
+    bit_buffer = 0
+    bit_count = 0
+
+    for byte in data:
+        bit_buffer |= byte << bit_count
+        bit_count += 8
+        while bit_count >= code_size:
+            code = bit_buffer & ((1 << code_size) - 1)
+            bit_buffer >>= code_size
+            bit_count -= code_size
+
+            if code == clear_code:
+                code_size = min_code_size + 1
+                del table[end_code + 1:]
+                previous = None
+                continue
+            if code == end_code:
+                return bytes(output[:pixel_count])
+
+            if code < len(table):
+                entry = table[code]
+                if previous is not None and len(table) < 4096:
+                    table.append(previous + entry[:1])
+            elif previous is not None:
+                entry = previous + previous[:1]
+                if len(table) < 4096:
+                    table.append(entry)
+            else:
+                raise ValueError("Corrupt GIF image data.")
+
+            output += entry
+            previous = entry
+            if len(table) == 1 << code_size and code_size < 12:
+                code_size += 1
+
+    return bytes(output[:pixel_count])
+
+
+def deinterlace(indices, width, height):
+    rows = [indices[y * width:(y + 1) * width] for y in range(height)]
+    ordered = [None] * height
+    row = 0
+    for start, step in ((0, 8), (4, 8), (2, 4), (1, 2)):
+        for y in range(start, height, step):
+            ordered[y] = rows[row]
+            row += 1
+    return b''.join(ordered)
+
+
+def indices_to_rgba(indices, palette, transparent_index):
+    # Map palette indices to RGBA a channel at a time with bytes.translate, which runs in C
+    colors = len(palette) // 3
+    red = bytes(palette[i * 3] if i < colors else 0 for i in range(256))
+    green = bytes(palette[i * 3 + 1] if i < colors else 0 for i in range(256))
+    blue = bytes(palette[i * 3 + 2] if i < colors else 0 for i in range(256))
+    alpha = bytes(0 if i == transparent_index else 255 for i in range(256))
+
+    rgba = bytearray(len(indices) * 4)
+    rgba[0::4] = indices.translate(red)
+    rgba[1::4] = indices.translate(green)
+    rgba[2::4] = indices.translate(blue)
+    rgba[3::4] = indices.translate(alpha)
+    return bytes(rgba)
+
+
+def read_sub_blocks(data, position):
+    chunks = []
+    while True:
+        length = data[position]
+        position += 1
+        if length == 0:
+            return b''.join(chunks), position
+        chunks.append(data[position:position + length])
+        position += length
+
+
+def decode_gif(data):
+    if data[:6] not in (b'GIF87a', b'GIF89a'):
+        raise ValueError("Not a GIF file.")
+    width, height, flags = struct.unpack_from('<HHB', data, 6)
+    position = 13
+    global_palette = None
+    if flags & 0x80:
+        palette_size = 3 << ((flags & 0x07) + 1)
+        global_palette = data[position:position + palette_size]
+        position += palette_size
+
+    canvas = pygame.Surface((width, height), pygame.SRCALPHA)
+    frames = []
+    delay = 0
+    disposal = 0
+    transparent_index = None
+
+    while position < len(data):
+        block = data[position]
+        position += 1
+
+        if block == 0x3B:  # Trailer
+            break
+
+        if block == 0x21:  # Extension
+            label = data[position]
+            position += 1
+            body, position = read_sub_blocks(data, position)
+            if label == 0xF9 and len(body) >= 4:  # Graphic control extension
+                packed, delay_cs, transparent = struct.unpack_from('<BHB', body)
+                disposal = (packed >> 2) & 0x07
+                delay = delay_cs * 10
+                transparent_index = transparent if packed & 0x01 else None
+            continue
+
+        if block != 0x2C:  # Image descriptor
+            raise ValueError(f"Unexpected GIF block 0x{block:02x}.")
+
+        left, top, frame_width, frame_height, frame_flags = struct.unpack_from('<HHHHB', data, position)
+        position += 9
+        palette = global_palette
+        if frame_flags & 0x80:
+            palette_size = 3 << ((frame_flags & 0x07) + 1)
+            palette = data[position:position + palette_size]
+            position += palette_size
+        min_code_size = data[position]
+        image_data, position = read_sub_blocks(data, position + 1)
+
+        pixel_count = frame_width * frame_height
+        indices = lzw_decode(image_data, min_code_size, pixel_count).ljust(pixel_count, b'\0')
+        if frame_flags & 0x40:
+            indices = deinterlace(indices, frame_width, frame_height)
+
+        previous_canvas = canvas.copy() if disposal == 3 else None
+        patch = pygame.image.frombytes(indices_to_rgba(indices, palette or b'', transparent_index),
+                                       (frame_width, frame_height), 'RGBA')
+        canvas.blit(patch, (left, top))
+        frames.append((canvas.copy(), delay))
+
+        if disposal == 2:
+            canvas.fill((0, 0, 0, 0), pygame.Rect(left, top, frame_width, frame_height))
+        elif disposal == 3:
+            canvas = previous_canvas
+
+        delay = 0
+        disposal = 0
+        transparent_index = None
+
+    return frames
@@ -0,0 +1,195 @@
+import hashlib
+import marshal
+import os
+import struct
+import zlib
+
+import pygame
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(base_dir, 'assets', 'cache')
+
+MAGIC = b'IHAC'
+DATA_MAGIC = b'IHAD'
+VERSION = 1
+HEADER = struct.Struct('<4sHI')
+COLORKEY = 'green'
+
+# Decoded surfaces stay here for the whole process, so a restart never decodes twice
+_memory = {}
+_shared = {}  # (content hash, variant) -> entry, so files with the same pixels share one set of surfaces
+_hashes = {}
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def file_hash(path):
+    signature = file_signature(path)
+    cached = _hashes.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    with open(path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    _hashes[path] = (signature, digest)
+    return digest
+
+
+def cache_path(source_path, variant):
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(CACHE_DIR, f"{name}-{variant}-{file_hash(source_path)[:16]}.bin")
+
+
+def pack_surfaces(surfaces, meta, colorkey):
+    pixel_format = 'RGB' if colorkey else 'RGBA'
+    header_data = marshal.dumps({
+        'format': pixel_format,
+        'sizes': [surface.get_size() for surface in surfaces],
+        'meta': meta,
+    })
+    pixels = b''.join(pygame.image.tobytes(surface, pixel_format) for surface in surfaces)
+    return HEADER.pack(MAGIC, VERSION, len(header_data)) + header_data + zlib.compress(pixels, 6)
+
+
+def unpack_surfaces(data, colorkey):
+    magic, version, header_length = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Unsupported asset cache entry.")
+    header_data = marshal.loads(data[HEADER.size:HEADER.size + header_length])
+    pixels = zlib.decompress(data[HEADER.size + header_length:])
+    pixel_format = header_data['format']
+    bytes_per_pixel = len(pixel_format)
+
+    surfaces = []
+    position = 0
+    for width, height in header_data['sizes']:
+        length = width * height * bytes_per_pixel
+        surface = pygame.image.frombytes(pixels[position:position + length], (width, height), pixel_format)
+        position += length
+        if colorkey:
+            # RLE-encoded colorkey frames skip their transparent runs when blitted, about three times faster
+            surface = surface.convert()
+            surface.set_colorkey(colorkey, pygame.RLEACCEL)
+        else:
+            surface = surface.convert_alpha()
+        surfaces.append(surface)
+    return surfaces, header_data['meta']
+
+
+def read_entry(path, colorkey):
+    try:
+        with open(path, 'rb') as f:
+            return unpack_surfaces(f.read(), colorkey)
+    except (OSError, ValueError, EOFError, zlib.error):
+        return None
+
+
+def write_entry(path, surfaces, meta, colorkey):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(pack_surfaces(surfaces, meta, colorkey))
+        os.replace(temp_path, path)
+    except OSError as e:
+        # A read-only or missing cache only costs speed, never correctness
+        print(f"Could not write asset cache entry {path}: {e}")
+
+
+def load_surfaces(source_path, variant, build, colorkey=None):
+    # build() returns (surfaces, meta) and only runs on a cache miss;
+    # meta must be marshal-friendly (numbers, strings, tuples, lists, dicts)
+    key = (source_path, variant)
+    signature = file_signature(source_path)
+    cached = _memory.get(key)
+    if cached and cached[0] == signature:
+        return cached[1], cached[2]
+
+    shared_key = (file_hash(source_path), variant)
+    entry = _shared.get(shared_key)
+    if entry is None:
+        path = cache_path(source_path, variant)
+        entry = read_entry(path, colorkey)
+        if entry is None:
+            entry = build()
+            write_entry(path, entry[0], entry[1], colorkey)
+        _shared[shared_key] = entry
+
+    _memory[key] = (signature, entry[0], entry[1])
+    return entry
+
+
+def load_data(source_path, variant, build):
+    # Like load_surfaces for plain marshal-friendly data, such as a compiled scene
+    key = (source_path, variant)
+    signature = file_signature(source_path)
+    cached = _memory.get(key)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    path = cache_path(source_path, variant)
+    data = None
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        magic, version, length = HEADER.unpack_from(raw)
+        if magic == DATA_MAGIC and version == VERSION:
+            data = marshal.loads(zlib.decompress(raw[HEADER.size:HEADER.size + length]))
+    except (OSError, ValueError, EOFError, zlib.error, struct.error):
+        data = None
+
+    if data is None:
+        data = build()
+        payload = zlib.compress(marshal.dumps(data), 6)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(HEADER.pack(DATA_MAGIC, VERSION, len(payload)) + payload)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Could not write asset cache entry {path}: {e}")
+
+    _memory[key] = (signature, data)
+    return data
+
+
+def forget(source_path):
+    for key in [key for key in _memory if key[0] == source_path]:
+        del _memory[key]
+    live = {id(cached[1]) for cached in _memory.values()}
+    for key in [key for key, entry in _shared.items() if id(entry[0]) not in live]:
+        del _shared[key]
+
+
+def build_cache(gif_sizes=((52, 32),)):
+    from support import import_tilemap
+    from animations import load_gif_atlas
+
+    characters_dir = os.path.join(base_dir, 'assets', 'graphics', 'characters')
+    for image in sorted(os.listdir(characters_dir)):
+        name, extension = os.path.splitext(image)
+        if extension == '.png':
+            import_tilemap(4, 4, characters_dir, name)
+            print(f"Cached character sheet {image}")
+
+    from regions import RegionStore
+    RegionStore.open(os.path.join(base_dir, 'assets', 'graphics', 'map', 'world.png'), threaded=False)
+    print("Cached map regions")
+
+    gifs_dir = os.path.join(base_dir, 'assets', 'graphics', 'gifs')
+    for image in sorted(os.listdir(gifs_dir)):
+        if image.endswith('.gif'):
+            for size in gif_sizes:
+                load_gif_atlas(os.path.join(gifs_dir, image), size)
+            print(f"Cached GIF {image}")
+
+
+if __name__ == '__main__':
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    build_cache()
+    pygame.quit()
@@ -0,0 +1,296 @@
+import argparse
+import asyncio
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+from settings import WINDOW_WIDTH, WINDOW_HEIGHT, TILE_SIZE
+from world import ChunkedWorld
+from regions import RegionStore, StreamedGround
+from headless import HeadlessRunner, InputScript
+from profiler import FRAME_STAGES
+from npc_behaviors import PathBehavior, WanderBehavior
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def camera_path(world_rect, frames):
+    # Sweep the camera top to bottom so both renderers see every part of the map
+    max_y = world_rect.height - WINDOW_HEIGHT
+    max_x = world_rect.width - WINDOW_WIDTH
+    for i in range(frames):
+        t = i / max(frames - 1, 1)
+        yield pygame.Rect(int(max_x * t), int(max_y * t), WINDOW_WIDTH, WINDOW_HEIGHT)
+
+
+def time_frames(draw, world_rect, frames):
+    timings = []
+    for camera_rect in camera_path(world_rect, frames):
+        start = time.perf_counter()
+        draw(camera_rect)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    mean = sum(timings) / len(timings)
+    p95 = timings[max(int(len(timings) * 0.95) - 1, 0)]
+    return mean, p95
+
+
+def report(name, timings):
+    mean, p95 = summarize(timings)
+    print(f"{name:<30} mean {mean * 1000:7.3f} ms   p95 {p95 * 1000:7.3f} ms")
+
+
+def world_blit_benchmark(frames=300):
+    display_surface = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+    world_image = pygame.image.load(os.path.join(base_dir, 'assets', 'graphics', 'map', 'world.png')).convert_alpha()
+    world_rect = world_image.get_rect()
+
+    # The previous renderer: an opaque copy of the whole map blitted at the camera offset
+    test_surface = pygame.Surface(world_rect.size)
+    test_surface.blit(world_image, (0, 0))
+
+    def full_blit(camera_rect):
+        display_surface.fill((0, 0, 0))
+        display_surface.blit(test_surface, (-camera_rect.x, -camera_rect.y))
+
+    world = ChunkedWorld(world_image)
+
+    def chunked(camera_rect):
+        # The camera is clamped inside the map, so the chunks always cover the screen and no clear is needed
+        world.draw(display_surface, camera_rect)
+
+    store = RegionStore.open(os.path.join(base_dir, 'assets', 'graphics', 'map', 'world.png'))
+    streamed = StreamedGround(store)
+
+    def streamed_draw(camera_rect):
+        streamed.draw(display_surface, camera_rect)
+
+    report('full blit', time_frames(full_blit, world_rect, frames))
+    report('chunked', time_frames(chunked, world_rect, frames))
+    report('streamed', time_frames(streamed_draw, world_rect, frames))
+    decoded = world_rect.width * world_rect.height * display_surface.get_bytesize()
+    print(f"streamed regions resident: {store.bytes / 2 ** 20:.1f} MB (whole map decoded: {decoded / 2 ** 20:.1f} MB)")
+
+
+def spawn_npcs(game, count, seed=0):
+    from entities import Character
+
+    rng = random.Random(seed)
+    sheets = ['blond', 'hat_girl', 'purple_girl', 'straw', 'npc1']
+    area = game.world_rect.inflate(-TILE_SIZE * 4, -TILE_SIZE * 4)
+
+    def random_point():
+        return rng.randint(area.left, area.right), rng.randint(area.top, area.bottom)
+
+    npcs = []
+    for i in range(count):
+        npc = Character(random_point(), game.overworld_frames['characters'][rng.choice(sheets)],
+                        game.all_sprites, game.world_rect, [f"I'm bench NPC {i}!"], is_npc=True)
+        npc.set_timers(game.timers)
+        if i % 2:
+            npc.set_behavior(PathBehavior([random_point() for _ in range(4)]))
+        else:
+            npc.set_behavior(WanderBehavior(wander_area=area))
+        npcs.append(npc)
+    return npcs
+
+
+def frame_benchmark(npc_counts, frames, seed=0, export=None, crowd=False, dirty=False, idle=False, backend=None):
+    from main import Game
+
+    game = Game(headless=True, backend=backend)
+    profiler = game.profiler
+    profiler.window = frames
+    game.dirty_rendering = dirty
+    results = {}
+    for count in npc_counts:
+        game.setup()
+        random.seed(seed)
+        if crowd:
+            game.spawn_crowd(count, seed=seed)
+        else:
+            spawn_npcs(game, count, seed)
+        # Idle runs send no input, so the camera stays put as on an unattended kiosk
+        runner = HeadlessRunner(game, InputScript() if idle else None)
+        profiler.enabled = False
+        runner.run(30)  # Warm up caches and the first dialogue bubbles
+
+        profiler.reset()
+        profiler.enabled = True
+        runner.run(frames)
+        timings = {name: list(samples) for name, samples in profiler.samples.items()}
+        timings['frame'] = [sum(stage_timings) for stage_timings in zip(*(timings[name] for name in FRAME_STAGES))]
+        results[count] = timings
+
+        print(f"\n{count} extra {'crowd ' if crowd else ''}NPCs, {frames} frames, {game.renderer.name} backend")
+        for name in FRAME_STAGES + ('frame',):
+            report(name, timings[name])
+        for name in sorted(name for name in timings if name.startswith('update ')):
+            report(name, timings[name])
+        if export:
+            root, extension = os.path.splitext(export)
+            profiler.export(f"{root}-{count}{extension}")
+    return results
+
+
+def entity_benchmark(npc_counts, frames, seed=0):
+    # Every entity updated every tick, around the level-of-detail scheduler, so the per-entity cost shows.
+    # Also reports what each NPC costs the memory allocator and the garbage collector, which has to walk
+    # every tracked object on a full collection, and how many collections the updates set off.
+    from main import Game
+    from settings import SIMULATION_DT
+
+    game = Game(headless=True)
+    collections = [0]
+
+    def count_collections(phase, info):
+        if phase == 'start':
+            collections[0] += 1
+
+    results = {}
+    for count in npc_counts:
+        game.setup()
+        random.seed(seed)
+        gc.collect()
+        tracked = len(gc.get_objects())
+        tracemalloc.start()
+        spawn_npcs(game, count, seed)
+        spawned, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        tracked = len(gc.get_objects()) - tracked
+        start = time.perf_counter()
+        gc.collect()
+        full_collection = time.perf_counter() - start
+
+        entities = list(game.all_sprites)
+        for _ in range(30):
+            for entity in entities:
+                entity.update(SIMULATION_DT)
+        timings = []
+        collections[0] = 0
+        gc.callbacks.append(count_collections)
+        for _ in range(frames):
+            start = time.perf_counter()
+            for entity in entities:
+                entity.update(SIMULATION_DT)
+            timings.append(time.perf_counter() - start)
+        gc.callbacks.remove(count_collections)
+        results[count] = timings
+
+        print(f"\n{count} extra NPCs, {len(entities)} entities, {frames} ticks")
+        if count:
+            print(f"{'memory per NPC':<30} {spawned / count:7.0f} bytes")
+            print(f"{'gc-tracked objects per NPC':<30} {tracked / count:7.1f}")
+        print(f"{'full gc collection':<30} {full_collection * 1000:7.3f} ms")
+        report('entity update', timings)
+        print(f"{'gc collections while updating':<30} {collections[0]:7d}")
+    return results
+
+
+def startup_benchmark():
+    # Time to the loading screen, to a fully set up game and to the first game frame, from the import of main
+    from main import Game
+
+    game = Game(headless=True, deferred=True)
+    asyncio.run(game.load())
+    HeadlessRunner(game).run(1)
+    for name, seconds in game.startup.items():
+        print(f"{name:<30} {seconds * 1000:7.1f} ms")
+    return game.startup
+
+
+def lap_check(name='moving_character', laps=1):
+    # Follows a path NPC with the camera, so it is updated every tick, and checks it reaches each of its
+    # waypoints in turn rather than freezing on a collider or skipping one it couldn't get to
+    from main import Game
+    from settings import SIMULATION_DT
+
+    game = Game(headless=True)
+    npc = game.entities[name]
+    behavior = npc.behavior
+    game.camera_target = npc
+    path = behavior.path
+    lap = sum(max(abs(b[0] - a[0]), abs(b[1] - a[1])) for a, b in zip(path, path[1:] + path[:1]))
+    frames = int(lap / behavior.speed / SIMULATION_DT * 2 * laps)
+    reach = behavior.speed * SIMULATION_DT + 1
+    runner = HeadlessRunner(game, InputScript())
+    reached = 0
+    for frame in range(frames):
+        index = behavior.current_index
+        waypoint = behavior.target_position
+        runner.run(1)
+        if behavior.current_index != index:
+            x, y = npc.rect.center
+            if max(abs(x - waypoint[0]), abs(y - waypoint[1])) > reach:
+                print(f"{name} skipped waypoint {index} {waypoint} from {npc.rect.center} at frame {frame}.")
+                return False
+            reached += 1
+            if reached == len(path) * laps:
+                print(f"{name} finished {laps} lap(s) of {len(path)} waypoints in {frame + 1} frames.")
+                return True
+    print(f"{name} reached {reached} of {len(path) * laps} waypoints in {frames} frames, "
+          f"stopped at {npc.rect.center} heading for waypoint {behavior.current_index}.")
+    return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless frame-time benchmarks for the InternHub.")
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--npcs', default='0,100,500', help="comma-separated extra NPC counts")
+    parser.add_argument('--startup', action='store_true', help="only measure time to the first frames")
+    parser.add_argument('--world', action='store_true', help="only compare the full-map and chunked world blits")
+    parser.add_argument('--entities', action='store_true',
+                        help="only time entity updates, with memory and garbage collector figures")
+    parser.add_argument('--laps', type=int,
+                        help="only check the scene's path NPC walks this many laps; exit non-zero if it doesn't")
+    parser.add_argument('--budget-ms', type=float, help="exit non-zero if any mean frame time exceeds this")
+    parser.add_argument('--crowd', action='store_true', help="spawn the extra NPCs through the numpy crowd backend")
+    parser.add_argument('--dirty', action='store_true', help="redraw only changed rects while the camera is still")
+    parser.add_argument('--idle', action='store_true', help="run without scripted input")
+    parser.add_argument('--backend', help="comma-separated render backends to compare: surface, texture")
+    parser.add_argument('--export', help="write per-stage percentiles to this .json or .csv path (one file per NPC count)")
+    args = parser.parse_args(argv)
+
+    pygame.init()
+    if args.world:
+        world_blit_benchmark(args.frames)
+        return 0
+    if args.startup:
+        startup_benchmark()
+        return 0
+    if args.laps:
+        return 0 if lap_check(laps=args.laps) else 1
+    if args.entities:
+        entity_benchmark([int(count) for count in args.npcs.split(',')], args.frames)
+        return 0
+
+    over_budget = False
+    for backend in args.backend.split(',') if args.backend else [None]:
+        export = args.export
+        if export and backend:
+            root, extension = os.path.splitext(export)
+            export = f"{root}-{backend}{extension}"
+        results = frame_benchmark([int(count) for count in args.npcs.split(',')], args.frames, export=export,
+                                  crowd=args.crowd, dirty=args.dirty, idle=args.idle, backend=backend)
+        if args.budget_ms is not None:
+            for count, timings in results.items():
+                mean, _ = summarize(timings['frame'])
+                if mean * 1000 > args.budget_ms:
+                    print(f"Mean frame time with {count} NPCs is over the {args.budget_ms} ms budget.")
+                    over_budget = True
+    return 1 if over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
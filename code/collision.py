@@ -0,0 +1,80 @@
+import pygame
+
+HITBOX_SIZE = (32, 16)
+HITBOX_BOTTOM_INSET = 8  # The feet sit a few pixels above the bottom of the 128x128 frames
+
+
+def feet_hitbox(rect):
+    hitbox = pygame.Rect((0, 0), HITBOX_SIZE)
+    hitbox.midbottom = (rect.centerx, rect.bottom - HITBOX_BOTTOM_INSET)
+    return hitbox
+
+
+class CollisionMap:
+    # Static colliders are the solid tiles of a WalkabilityGrid, so the broad phase is just
+    # the handful of tiles under a hitbox and the narrow phase pushes back along one axis at a time
+    def __init__(self, grid):
+        self.grid = grid
+        self.tile_size = grid.tile_size
+
+    def tile_range(self, rect):
+        tile_size = self.tile_size
+        return (rect.left // tile_size, (rect.right - 1) // tile_size,
+                rect.top // tile_size, (rect.bottom - 1) // tile_size)
+
+    def solid_tiles(self, rect):
+        grid = self.grid
+        first_col, last_col, first_row, last_row = self.tile_range(rect)
+        solid = set()
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                if not grid.walkable(col, row):
+                    solid.add((col, row))
+        return solid
+
+    def collides(self, rect):
+        return bool(self.solid_tiles(rect))
+
+    def crosses(self, hitbox, dx, dy):
+        # Whether moving by (dx, dy) takes the hitbox over a tile it isn't on yet; when not, there is
+        # nothing new to collide with. The common case by far, so it is checked without building anything.
+        tile_size = self.tile_size
+        left, top = hitbox.left, hitbox.top
+        right, bottom = hitbox.right - 1, hitbox.bottom - 1
+        return (left // tile_size != (left + dx) // tile_size or right // tile_size != (right + dx) // tile_size or
+                top // tile_size != (top + dy) // tile_size or bottom // tile_size != (bottom + dy) // tile_size)
+
+    def resolve(self, hitbox, dx, dy):
+        # Returns the allowed (dx, dy) plus whether each axis was blocked. Tiles the hitbox
+        # already overlaps are ignored, so a character placed on a desk can still walk off it.
+        tile_size = self.tile_size
+        blocked_x = blocked_y = False
+        if not self.crosses(hitbox, dx, dy):
+            return dx, dy, False, False
+        start = self.solid_tiles(hitbox)
+
+        if dx:
+            moved = hitbox.move(dx, 0)
+            hits = self.solid_tiles(moved) - start
+            if hits:
+                blocked_x = True
+                if dx > 0:
+                    moved.right = min(col for col, _ in hits) * tile_size
+                else:
+                    moved.left = (max(col for col, _ in hits) + 1) * tile_size
+                dx = moved.x - hitbox.x
+            hitbox = hitbox.move(dx, 0)
+            start = self.solid_tiles(hitbox)
+
+        if dy:
+            moved = hitbox.move(0, dy)
+            hits = self.solid_tiles(moved) - start
+            if hits:
+                blocked_y = True
+                if dy > 0:
+                    moved.bottom = min(row for _, row in hits) * tile_size
+                else:
+                    moved.top = (max(row for _, row in hits) + 1) * tile_size
+                dy = moved.y - hitbox.y
+
+        return dx, dy, blocked_x, blocked_y
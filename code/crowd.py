@@ -0,0 +1,215 @@
+import random
+
+import pygame
+
+try:
+    import numpy as np
+except ImportError:  # The crowd backend is optional; the game runs without it
+    np = None
+
+DIRECTIONS = ('down', 'left', 'right', 'up')
+PATH, WANDER = 0, 1
+CROWD_STATE = ('position', 'direction', 'facing', 'frame_time', 'bob_time', 'path_index', 'wander_timer')
+
+# Bobbing as in Character.bob_down: 5s wait, 5px down for 500ms, back up, 5s wait, repeat
+BOB_PERIOD = 10500
+BOB_DOWN_START = 5000
+BOB_DOWN_END = 5500
+BOB_DISTANCE = 5
+
+
+class CrowdSprite(pygame.sprite.Sprite):
+    # Never added to a group: the Crowd simulates it and hands it to AllSprites.draw only while visible
+    def __init__(self, frames, pos):
+        super().__init__()
+        self.frames = frames
+        self.image = frames['down_idle'][0]
+        self.rect = self.image.get_rect(center=pos)
+        self.previous_topleft = self.rect.topleft
+
+
+class Crowd:
+    def __init__(self, world_rect, seed=None, view_margin=64):
+        if np is None:
+            raise RuntimeError("The crowd backend needs numpy.")
+        self.world_rect = world_rect
+        self.view_margin = view_margin
+        self.rng = np.random.default_rng(seed)
+        self.sprites = []
+        self.pending = []
+        self.visible = []
+        self.count = 0
+        self.visible_mask = np.zeros(0, dtype=bool)
+
+    def add_path_npc(self, pos, frames, path, speed=100):
+        self.pending.append((PATH, pos, frames, list(path), speed, None, 0))
+        return self
+
+    def add_wander_npc(self, pos, frames, wander_area=None, speed=100, direction_change_interval=3.0):
+        area = pygame.Rect(wander_area) if wander_area else self.world_rect
+        self.pending.append((WANDER, pos, frames, None, speed, area, direction_change_interval))
+        return self
+
+    def populate(self, count, frame_sets, area=None, seed=None):
+        rng = random.Random(seed)
+        area = pygame.Rect(area) if area else self.world_rect
+
+        def random_point():
+            return rng.randint(area.left, area.right), rng.randint(area.top, area.bottom)
+
+        for i in range(count):
+            frames = rng.choice(frame_sets)
+            if i % 2:
+                self.add_path_npc(random_point(), frames, [random_point() for _ in range(4)])
+            else:
+                self.add_wander_npc(random_point(), frames, area)
+        self.build()
+        return self
+
+    def build(self):
+        # Pack everything added so far into flat arrays; only done when the crowd changes
+        for kind, pos, frames, path, speed, area, interval in self.pending:
+            sprite = CrowdSprite(frames, pos)
+            sprite.crowd_kind = kind
+            sprite.crowd_path = path or []
+            sprite.crowd_speed = speed
+            sprite.crowd_area = area
+            sprite.crowd_interval = interval
+            self.sprites.append(sprite)
+        self.pending.clear()
+
+        n = self.count = len(self.sprites)
+        sprites = self.sprites
+        self.position = np.array([sprite.rect.center for sprite in sprites], dtype=np.float64).reshape(n, 2)
+        self.half_size = np.array([sprite.rect.size for sprite in sprites], dtype=np.float64).reshape(n, 2) / 2
+        self.kind = np.array([sprite.crowd_kind for sprite in sprites], dtype=np.int8)
+        self.speed = np.array([sprite.crowd_speed for sprite in sprites], dtype=np.float64)
+        self.direction = np.zeros((n, 2))
+        self.facing = np.zeros(n, dtype=np.int8)
+        self.frame_time = np.zeros(n)
+        self.bob_time = self.rng.uniform(0, BOB_PERIOD, n)
+
+        paths = [sprite.crowd_path or [sprite.rect.center] for sprite in sprites]
+        self.path_length = np.array([len(path) for path in paths], dtype=np.int64)
+        self.path_start = np.concatenate(([0], np.cumsum(self.path_length)[:-1])).astype(np.int64)
+        self.waypoints = np.array([point for path in paths for point in path], dtype=np.float64).reshape(-1, 2)
+        self.path_index = np.zeros(n, dtype=np.int64)
+
+        self.wander_area = np.array([tuple(sprite.crowd_area) if sprite.crowd_area else (0, 0, 0, 0)
+                                     for sprite in sprites], dtype=np.float64).reshape(n, 4)
+        self.wander_interval = np.array([sprite.crowd_interval for sprite in sprites], dtype=np.float64)
+        self.wander_timer = np.zeros(n)
+        self.is_path = self.kind == PATH
+        self.is_wander = self.kind == WANDER
+        self.direction[self.is_wander] = self.random_diagonals(int(self.is_wander.sum()))
+        self.visible_mask = np.zeros(n, dtype=bool)
+
+    def snapshot(self):
+        if self.pending:
+            self.build()
+        return {name: getattr(self, name).tobytes() for name in CROWD_STATE}
+
+    def restore(self, state):
+        if self.pending:
+            self.build()
+        for name in CROWD_STATE:
+            array = getattr(self, name)
+            setattr(self, name, np.frombuffer(state[name], dtype=array.dtype).reshape(array.shape).copy())
+        self.visible_mask = np.zeros(self.count, dtype=bool)
+
+    def random_diagonals(self, count):
+        return self.rng.choice((-1.0, 1.0), size=(count, 2)) / np.sqrt(2)
+
+    def update_paths(self, dt):
+        mask = self.is_path
+        targets = self.waypoints[self.path_start + self.path_index]
+        diff = targets - self.position
+        # Chebyshev distance, as PathBehavior uses
+        distance = np.abs(diff).max(axis=1)
+        arrived = mask & (distance < 1)
+        self.path_index[arrived] = (self.path_index[arrived] + 1) % self.path_length[arrived]
+
+        moving = mask & ~arrived
+        step = diff[moving] / distance[moving, None]
+        self.position[moving] += step * (self.speed[moving, None] * dt)
+        self.direction[moving] = step
+
+    def update_wanderers(self, dt):
+        mask = self.is_wander
+        self.wander_timer[mask] += dt
+        change = mask & (self.wander_timer >= self.wander_interval)
+        if change.any():
+            self.wander_timer[change] = 0
+            self.direction[change] = self.random_diagonals(int(change.sum()))
+
+        self.position[mask] += self.direction[mask] * (self.speed[mask, None] * dt)
+
+        # Bounce off the wander area the way WanderBehavior does, working on rect edges
+        area = self.wander_area
+        low = area[:, 0:2] + self.half_size
+        high = area[:, 0:2] + area[:, 2:4] - self.half_size
+        below = mask[:, None] & (self.position < low)
+        above = mask[:, None] & (self.position > high)
+        self.position = np.where(below, low, np.where(above, high, self.position))
+        self.direction[below | above] *= -1
+
+    def update_animation(self, dt):
+        direction = self.direction
+        x, y = direction[:, 0], direction[:, 1]
+        # Same precedence as Entity.get_state: vertical movement wins over horizontal
+        facing = np.where(x > 0, 2, np.where(x < 0, 1, self.facing))
+        facing = np.where(y > 0, 0, np.where(y < 0, 3, facing))
+        self.facing = facing.astype(np.int8)
+        self.frame_time += 6 * dt
+        self.bob_time = (self.bob_time + dt * 1000) % BOB_PERIOD
+
+    def update(self, dt, camera_rect):
+        if self.pending:
+            self.build()
+        if not self.count:
+            return
+
+        self.update_paths(dt)
+        self.update_wanderers(dt)
+        self.update_animation(dt)
+
+        view = camera_rect.inflate(self.view_margin * 2, self.view_margin * 2)
+        low = self.position - self.half_size
+        high = self.position + self.half_size
+        visible = ((high[:, 0] > view.left) & (low[:, 0] < view.right) &
+                   (high[:, 1] > view.top) & (low[:, 1] < view.bottom))
+
+        # Sprites that just left the view get one last write so they are not drawn at a stale spot
+        was_visible = self.visible_mask
+        write = np.flatnonzero(visible | was_visible)
+        self.visible_mask = visible
+
+        bobbing = (self.bob_time >= BOB_DOWN_START) & (self.bob_time < BOB_DOWN_END)
+        centers = self.position[write].astype(np.int64)
+        centers[:, 1] += bobbing[write] * BOB_DISTANCE
+        facings = self.facing[write]
+        frames = self.frame_time[write].astype(np.int64)
+
+        sprites = self.sprites
+        shown = []
+        for i, (cx, cy), facing, frame in zip(write.tolist(), centers.tolist(), facings.tolist(), frames.tolist()):
+            sprite = sprites[i]
+            rect = sprite.rect
+            previous_topleft = rect.topleft
+            animation = sprite.frames[DIRECTIONS[facing]]
+            sprite.image = animation[frame % len(animation)]
+            rect.center = (cx, cy)
+            # Nothing to interpolate from when a sprite has just come into view
+            sprite.previous_topleft = previous_topleft if was_visible[i] else rect.topleft
+            if visible[i]:
+                shown.append(sprite)
+        self.visible = shown
+
+    def query_rect(self, rect):
+        if not self.count:
+            return []
+        low = self.position - self.half_size
+        high = self.position + self.half_size
+        hits = ((high[:, 0] > rect.left) & (low[:, 0] < rect.right) &
+                (high[:, 1] > rect.top) & (low[:, 1] < rect.bottom))
+        return [self.sprites[i] for i in np.flatnonzero(hits).tolist()]
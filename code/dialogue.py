@@ -0,0 +1,108 @@
+from collections import OrderedDict, deque
+from functools import lru_cache
+
+import pygame
+
+BUBBLE_SIZE = (300, 100)
+BUBBLE_PADDING = 10
+BUBBLE_COLOR = (255, 255, 255)
+BUBBLE_BORDER_COLOR = (0, 255, 0)
+TEXT_COLOR = (0, 0, 0)
+
+_fonts = {}
+
+
+def get_font(name=None, size=36):
+    # Font construction reads the font file, so each (name, size) is built once per run
+    font = _fonts.get((name, size))
+    if font is None:
+        font = _fonts[(name, size)] = pygame.font.Font(name, size)
+    return font
+
+
+@lru_cache(maxsize=256)
+def wrap_text(text, font, max_width):
+    words = text.split(' ')
+    lines = []
+    current_line = ""
+
+    for word in words:
+        test_line = current_line + word + " "
+        if font.size(test_line)[0] <= max_width:
+            current_line = test_line
+        else:
+            lines.append(current_line.strip())
+            current_line = word + " "
+
+    if current_line:
+        lines.append(current_line.strip())
+
+    return tuple(lines)
+
+
+def draw_rounded_rect(surface, color, rect, radius, border_color=None, border_width=0):
+    rect = pygame.Rect(rect)
+    shape_surf = pygame.Surface(rect.size, pygame.SRCALPHA)
+
+    pygame.draw.rect(shape_surf, color, shape_surf.get_rect(), border_radius=radius)
+
+    if border_color and border_width > 0:
+        pygame.draw.rect(shape_surf, border_color, shape_surf.get_rect(), border_radius=radius, width=border_width)
+
+    surface.blit(shape_surf, rect.topleft)
+
+
+class DialogueRenderer:
+    def __init__(self, font_size=36, cache_size=64):
+        self.font = get_font(None, font_size)
+        self.cache_size = cache_size
+        self.bubbles = OrderedDict()
+        self.pending = deque()
+        self.background = None
+
+    def render_bubble(self, text):
+        if self.background is None:
+            self.background = pygame.Surface(BUBBLE_SIZE, pygame.SRCALPHA)
+            draw_rounded_rect(self.background, BUBBLE_COLOR, self.background.get_rect(), 10,
+                              border_color=BUBBLE_BORDER_COLOR, border_width=5)
+
+        bubble = self.background.copy()
+        max_text_width = BUBBLE_SIZE[0] - 2 * BUBBLE_PADDING
+        y_offset = BUBBLE_PADDING
+        for line in wrap_text(text, self.font, max_text_width):
+            bubble.blit(self.font.render(line, True, TEXT_COLOR), (BUBBLE_PADDING, y_offset))
+            y_offset += self.font.get_height()
+        return bubble
+
+    def bubble(self, character, dialog_index=None):
+        if dialog_index is None:
+            dialog_index = character.current_dialog_index
+        key = (character, dialog_index)
+        text = character.dialogs[dialog_index]
+
+        cached = self.bubbles.get(key)
+        if cached is not None and cached[0] == text:
+            self.bubbles.move_to_end(key)
+            return cached[1]
+
+        bubble = self.render_bubble(text)
+        self.bubbles[key] = (text, bubble)
+        if len(self.bubbles) > self.cache_size:
+            self.bubbles.popitem(last=False)
+        return bubble
+
+    def prerender(self, characters):
+        for character in characters:
+            for dialog_index in range(len(character.dialogs)):
+                self.pending.append((character, dialog_index))
+
+    def pump(self, max_bubbles=1):
+        # Spread prerendering over frames so it never stalls the loop, including under pygbag where there are no threads
+        for _ in range(min(max_bubbles, len(self.pending))):
+            character, dialog_index = self.pending.popleft()
+            if dialog_index < len(character.dialogs):
+                self.bubble(character, dialog_index)
+
+    def clear(self):
+        self.bubbles.clear()
+        self.pending.clear()
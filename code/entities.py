@@ -1,80 +1,172 @@
 import itertools
+import math
 
 import pygame
+from settings import STUCK_TIME
 from npc_behaviors import Behavior
+from animations import load_gif_atlas
+from collision import HITBOX_SIZE, HITBOX_BOTTOM_INSET, feet_hitbox
+
+# Animation states are small ints indexing a per-entity frame table: facing * 2, plus 1 when idle
+DIRECTIONS = ('down', 'left', 'right', 'up')
+DOWN, LEFT, RIGHT, UP = range(4)
+STATE_NAMES = tuple(name + suffix for name in DIRECTIONS for suffix in ('', '_idle'))
+NOT_BLOCKED = (False, False)
+
+
+def frame_table(frames):
+    return tuple(frames[name] for name in STATE_NAMES)
 
 
 class Entity(pygame.sprite.Sprite):
+    # Slotted, as a crowd holds hundreds of these; only pygame's own group bookkeeping stays in a __dict__
+    __slots__ = ('frame_index', 'frames', 'frame_table', 'facing', 'direction', 'speed', 'animation_speed',
+                 'image', 'rect', 'hitbox', 'previous_topleft', 'following', 'trail_distance', 'world_rect',
+                 'collision_map', 'carry_x', 'carry_y')
+
     def __init__(self, pos, frames, groups, world_rect):
         super().__init__(groups)
+        self.collision_map = None  # Set by the game once the map's colliders are baked
         self.frame_index = 0
         self.frames = frames
-        self.facing_direction = 'down'
-        self.direction = pygame.math.Vector2()
+        self.frame_table = frame_table(frames)
+        self.facing = DOWN
+        self.direction = pygame.math.Vector2()  # Only ever changed in place
         self.speed = 125
         self.animation_speed = 6
-        self.image = self.frames[self.get_state()][self.frame_index]
+        self.image = self.frame_table[self.get_state_code()][self.frame_index]
         self.rect = self.image.get_rect(center=pos)
-        self.following = []
+        self.hitbox = pygame.Rect((0, 0), HITBOX_SIZE)
+        self.carry_x = self.carry_y = 0.0  # The part of a pixel move_by hasn't moved yet
+        self.previous_topleft = self.rect.topleft
+        self.following = ()  # Empty tuples are shared and never tracked by the garbage collector
         self.trail_distance = 100
         self.world_rect = world_rect
 
+    @property
+    def facing_direction(self):
+        return DIRECTIONS[self.facing]
+
+    @facing_direction.setter
+    def facing_direction(self, name):
+        self.facing = DIRECTIONS.index(name)
+
     def move(self, dt):
-        movement = self.direction * self.speed * dt
-        self.rect.center += movement
+        direction = self.direction
+        step = self.speed * dt
+        self.move_by(direction.x * step, direction.y * step)
+
+    def move_by(self, dx, dy):
+        # The rect moves in whole pixels and the fractions are carried over, so many small steps and one
+        # long step (a sprite updated every few ticks) cover the same distance at the same speed
+        dx += self.carry_x
+        dy += self.carry_y
+        whole_x, whole_y = round(dx), round(dy)
+        self.carry_x, self.carry_y = dx - whole_x, dy - whole_y
+        dx, dy = whole_x, whole_y
+        rect = self.rect
+        blocked = NOT_BLOCKED
+        collision_map = self.collision_map
+        if collision_map is not None and (dx or dy):
+            # The feet hitbox is kept per entity and moved in place rather than rebuilt every step
+            hitbox = self.hitbox
+            hitbox.centerx = rect.centerx
+            hitbox.bottom = rect.bottom - HITBOX_BOTTOM_INSET
+            if collision_map.crosses(hitbox, dx, dy):
+                dx, dy, blocked_x, blocked_y = collision_map.resolve(hitbox, dx, dy)
+                blocked = blocked_x, blocked_y
+                if blocked_x:
+                    self.carry_x = 0.0
+                if blocked_y:
+                    self.carry_y = 0.0
+        rect.x += dx
+        rect.y += dy
 
         # Ensure character stays within world boundaries
-        if self.rect.left < self.world_rect.left:
-            self.rect.left = self.world_rect.left
-        if self.rect.right > self.world_rect.right:
-            self.rect.right = self.world_rect.right
-        if self.rect.top < self.world_rect.top:
-            self.rect.top = self.world_rect.top
-        if self.rect.bottom > self.world_rect.bottom:
-            self.rect.bottom = self.world_rect.bottom
+        world_rect = self.world_rect
+        if rect.left < world_rect.left:
+            rect.left = world_rect.left
+        if rect.right > world_rect.right:
+            rect.right = world_rect.right
+        if rect.top < world_rect.top:
+            rect.top = world_rect.top
+        if rect.bottom > world_rect.bottom:
+            rect.bottom = world_rect.bottom
+        return blocked
 
     def animate(self, dt):
+        frames = self.frame_table[self.get_state_code()]
         self.frame_index += self.animation_speed * dt
-        self.image = self.frames[self.get_state()][int(self.frame_index % len(self.frames[self.get_state()]))]
+        self.image = frames[int(self.frame_index % len(frames))]
+
+    def get_state_code(self):
+        direction = self.direction
+        x, y = direction.x, direction.y
+        if not (x or y):
+            return self.facing * 2 + 1
+        if x:
+            self.facing = RIGHT if x > 0 else LEFT
+        if y:
+            self.facing = DOWN if y > 0 else UP
+        return self.facing * 2
 
     def get_state(self):
-        moving = bool(self.direction.length_squared() > 0)
-        if moving:
-            if self.direction.x != 0:
-                self.facing_direction = 'right' if self.direction.x > 0 else 'left'
-            if self.direction.y != 0:
-                self.facing_direction = 'down' if self.direction.y > 0 else 'up'
-        return f"{self.facing_direction}{'' if moving else '_idle'}"
+        return STATE_NAMES[self.get_state_code()]
+
+    def snapshot(self):
+        # Plain tuples only, so snapshots can be kept in memory or marshalled into a checkpoint
+        direction = self.direction
+        return (self.rect.topleft, self.frame_index, self.facing, (direction.x, direction.y), self.speed,
+                self.animation_speed)
+
+    def restore(self, state):
+        topleft, self.frame_index, self.facing, direction, self.speed, self.animation_speed = state[:6]
+        self.rect.topleft = topleft
+        self.previous_topleft = self.rect.topleft
+        self.carry_x = self.carry_y = 0.0
+        self.direction.update(direction)
+        frames = self.frame_table[self.get_state_code()]
+        self.image = frames[int(self.frame_index % len(frames))]
 
     def update(self, dt):
         if self.following:
+            center_x, center_y = self.rect.center
             for follower in self.following:
-                direction = pygame.math.Vector2(self.rect.center) - pygame.math.Vector2(follower.rect.center)
-                distance = direction.length()
+                dx = center_x - follower.rect.centerx
+                dy = center_y - follower.rect.centery
+                distance = math.hypot(dx, dy)
                 if distance > follower.trail_distance:
-                    follower.direction = direction.normalize() if direction.length() > 0 else pygame.math.Vector2()
+                    follower.direction.update(dx / distance, dy / distance)
                     follower.move(dt)
                 else:
-                    follower.direction = pygame.math.Vector2()
+                    follower.direction.update(0, 0)
 
         self.move(dt)
         self.animate(dt)
 
 class Character(Entity):
+    __slots__ = ('behavior', 'team', 'is_team_member', 'current_character', 'dialogs', 'current_dialog_index',
+                 'speech_bubble', 'bubble_timer', 'stop_moving', 'following_leader', 'target_position',
+                 'reached_target', 'path_waypoints', 'meeting_point', 'is_npc', 'original_y', 'movement_direction',
+                 'movement_interval', 'movement_distance', 'timers', 'bob_timer', 'stuck_time', 'pathfinder')
+
     def __init__(self, pos, frames, groups, world_rect, dialogs=None, is_npc=False):
         super().__init__(pos, frames, groups, world_rect)
+        self.meeting_point = None  # Where the character heads once the camera moves to another intern
         self.behavior = Behavior()
-        self.team = []
+        self.team = ()
         self.is_team_member = False
         self.current_character = None
         self.dialogs = dialogs if dialogs else ["Default dialog."]
         self.current_dialog_index = 0
         self.speech_bubble = None
-        self.speech_bubble_start_time = None
+        self.bubble_timer = None
         self.stop_moving = False
         self.following_leader = None
         self.target_position = None  # The target position the character should move toward
         self.reached_target = True  # Indicates whether the character has reached the target
+        self.path_waypoints = ()  # Remaining waypoints after target_position, from the pathfinder
+        self.stuck_time = 0.0  # How long move_by has let it make no progress towards target_position
 
         # Add these attributes for NPC-specific movement
         self.is_npc = is_npc
@@ -82,14 +174,77 @@ class Character(Entity):
         self.movement_direction = 1
         self.movement_interval = 5000  # 5 seconds
         self.movement_distance = 5  # Move 5 pixels up and down
-        self.last_movement_time = pygame.time.get_ticks()
+        self.timers = None  # The game's timers.Timers, which run the bobbing and bubble timeouts
+        self.bob_timer = None
+        self.pathfinder = None  # The game's Pathfinder, set alongside collision_map
 
     def set_behavior(self, behavior):
         self.behavior = behavior
 
+    def set_timers(self, timers):
+        self.timers = timers
+        if self.is_npc:
+            self.bob_timer = timers.after(self.movement_interval, self.bob_down)
+
     def move_to(self, target_position):
         self.target_position = pygame.math.Vector2(target_position)
         self.reached_target = False
+        self.stuck_time = 0.0
+
+    def give_up_target(self):
+        # Something the route didn't plan for is in the way: stop and hand control back instead of
+        # walking into it forever, as input only reaches characters that have reached their target
+        self.target_position = None
+        self.path_waypoints = ()
+        self.reached_target = True
+        self.stuck_time = 0.0
+        self.direction.update(0, 0)
+
+    def advance(self, elapsed):
+        self.behavior.advance(self, elapsed)
+        self.frame_index += self.animation_speed * elapsed
+
+    def snapshot(self):
+        target = self.target_position
+        return super().snapshot() + (
+            self.current_dialog_index, self.stop_moving, self.current_character is self,
+            (target.x, target.y) if target is not None else None, self.reached_target, tuple(self.path_waypoints),
+            self.original_y, self.movement_direction,
+            self.timers.remaining(self.bob_timer) if self.timers else None, self.behavior.snapshot())
+
+    def restore(self, state):
+        super().restore(state)
+        (self.current_dialog_index, self.stop_moving, is_current, target, self.reached_target, waypoints,
+         self.original_y, self.movement_direction, until_bob, behavior) = state[6:]
+        self.current_character = self if is_current else None
+        self.target_position = pygame.math.Vector2(target) if target is not None else None
+        self.stuck_time = 0.0
+        self.path_waypoints = list(waypoints)
+        if self.bob_timer is not None:
+            self.bob_timer.cancel()
+            self.bob_timer = None
+        if until_bob is not None and self.timers:
+            step = self.bob_up if self.movement_direction == -1 else self.bob_down
+            self.bob_timer = self.timers.after(until_bob, step)
+        self.behavior.restore(behavior)
+        self.hide_speech_bubble()
+
+    def plan_route(self, target_position, callback):
+        # The route is planned for the feet hitbox, which is what collides, then shifted back to where
+        # rect.center goes. callback gets the waypoints, or None when there is no route.
+        hitbox = feet_hitbox(self.rect)
+        offset_x = hitbox.centerx - self.rect.centerx
+        offset_y = hitbox.centery - self.rect.centery
+
+        def on_path(waypoints):
+            callback([(x - offset_x, y - offset_y) for x, y in waypoints] if waypoints else None)
+
+        goal = (target_position[0] + offset_x, target_position[1] + offset_y)
+        self.pathfinder.request(hitbox.center, goal, on_path)
+
+    def follow_path(self, waypoints):
+        self.path_waypoints = list(waypoints[1:])
+        self.move_to(waypoints[0])
 
     def interact(self):
         # Get the current dialog based on the current index
@@ -99,19 +254,33 @@ class Character(Entity):
         # Cycle to the next dialog
         self.current_dialog_index = (self.current_dialog_index + 1) % len(self.dialogs)
 
-    def input(self):
+    def show_speech_bubble(self, bubble, timeout=None):
+        # Shown until hidden, or for timeout milliseconds of game time
+        self.hide_speech_bubble()
+        self.speech_bubble = bubble
+        if timeout is not None and self.timers:
+            self.bubble_timer = self.timers.after(timeout, self.hide_speech_bubble)
+
+    def hide_speech_bubble(self):
+        self.speech_bubble = None
+        if self.bubble_timer is not None:
+            self.bubble_timer.cancel()
+            self.bubble_timer = None
+
+    def input(self, keys=None):
         if self == self.current_character and self.reached_target:
-            keys = pygame.key.get_pressed()
-            input_vector = pygame.math.Vector2()
+            if keys is None:
+                keys = pygame.key.get_pressed()
+            x = y = 0
 
             if keys[pygame.K_w]:
-                input_vector.y -= 1
+                y -= 1
             if keys[pygame.K_s]:
-                input_vector.y += 1
+                y += 1
             if keys[pygame.K_a]:
-                input_vector.x -= 1
+                x -= 1
             if keys[pygame.K_d]:
-                input_vector.x += 1
+                x += 1
 
 
             # Determine speed and animation speed based on keys pressed
@@ -128,111 +297,102 @@ class Character(Entity):
                 self.speed = 125
                 self.animation_speed = 6
 
-            self.direction = input_vector.normalize() if input_vector.length() > 0 else pygame.math.Vector2()
+            self.direction.update(x, y)
+            if x or y:
+                self.direction.normalize_ip()
 
     def update(self, dt):
         if self.behavior:
             self.behavior.update(self, dt)
 
-        if not self.reached_target and self.target_position:
-            self.direction = self.target_position - pygame.math.Vector2(self.rect.center)
-            if self.direction.length() < 5:
-                self.rect.center = self.target_position
-                self.direction = pygame.math.Vector2()
+        if self.reached_target and self.path_waypoints:
+            self.move_to(self.path_waypoints.pop(0))
+
+        target = self.target_position
+        if not self.reached_target and target:
+            dx = target.x - self.rect.centerx
+            dy = target.y - self.rect.centery
+            distance = math.hypot(dx, dy)
+            if distance < 5:
+                self.rect.center = target
+                self.direction.update(0, 0)
                 self.reached_target = True
             else:
-                self.direction = self.direction.normalize()
+                self.direction.update(dx / distance, dy / distance)
 
+        heading = not self.reached_target
+        left, top = self.rect.left, self.rect.top
         super().update(dt)
-
-        if self.is_npc:
-            self.npc_up_down_movement()  # Apply the bobbing movement
-
-        if self.speech_bubble and self.speech_bubble_start_time:
-            if pygame.time.get_ticks() - self.speech_bubble_start_time > 5000:
-                self.speech_bubble = None
-                self.speech_bubble_start_time = None
+        if heading:
+            if self.rect.left == left and self.rect.top == top:
+                self.stuck_time += dt
+                if self.stuck_time >= STUCK_TIME:
+                    self.give_up_target()
+            else:
+                self.stuck_time = 0.0
 
         if self.following_leader:
             self.follow(self.following_leader, dt)
 
-    def npc_up_down_movement(self):
-        current_time = pygame.time.get_ticks()
-
-        if self.movement_direction == 1:  # Moving down
-            if current_time - self.last_movement_time >= self.movement_interval:
-                self.rect.y += self.movement_distance
-                self.movement_direction = -1  # Change direction to up
-                self.last_movement_time = current_time  # Reset the timer for the delay before moving up
-
-        elif self.movement_direction == -1:  # Wait before moving up
-            if current_time - self.last_movement_time >= 500:  # 500ms delay before moving back up
-                self.rect.y -= self.movement_distance
-                self.movement_direction = 0  # Set to 0 to indicate waiting for the next cycle
-                self.last_movement_time = current_time  # Reset the timer for the next movement cycle
+    # NPC bobbing: wait movement_interval, move down, come back up 500ms later, repeat.
+    # Timer callbacks, so a waiting NPC costs nothing per frame.
+    def bob_down(self):
+        if not self.alive():
+            return
+        self.rect.y += self.movement_distance
+        self.movement_direction = -1  # Down, waiting to move back up
+        self.bob_timer = self.timers.after(500, self.bob_up)
 
-        elif self.movement_direction == 0:  # Wait before starting the next cycle
-            if current_time - self.last_movement_time >= self.movement_interval:
-                self.movement_direction = 1  # Reset direction for the next cycle
+    def bob_up(self):
+        if not self.alive():
+            return
+        self.rect.y -= self.movement_distance
+        self.movement_direction = 0  # Waiting for the next cycle
+        self.bob_timer = self.timers.after(self.movement_interval, self.bob_down)
 
 
 class GifAnimation(pygame.sprite.Sprite):
+    __slots__ = ('atlas', 'frames', 'durations', 'frame_index', 'frame_time', 'image', 'rect', 'previous_topleft',
+                 'size')
+
     def __init__(self, pos, gif_path, size, groups):
         super().__init__(groups)
-        self.frames = self.load_gif_frames(gif_path, size)
+        self.atlas = self.load_gif_atlas(gif_path, size)
+        self.frames = self.atlas.frames if self.atlas else []
+        self.durations = self.atlas.durations if self.atlas else []
         self.frame_index = 0
+        self.frame_time = 0
         self.image = self.frames[self.frame_index] if self.frames else pygame.Surface((0, 0))
         self.rect = self.image.get_rect(topleft=pos)
+        self.previous_topleft = self.rect.topleft
         self.size = size  # Store the desired size
 
-    def load_gif_frames(self, gif_path, size):
-        frames = []
+    @staticmethod
+    def load_gif_atlas(gif_path, size):
         try:
-            gif = pygame.image.load(gif_path).convert_alpha()
-            gif_width, gif_height = gif.get_size()
-
-
-            width, height = size
-            if width <= 0 or height <= 0:
-                raise ValueError("Invalid frame size dimensions.")
-
-            num_frames = gif_height // height
-            extra_height = gif_height % height
-
-            for i in range(num_frames):
-                try:
-                    rect = pygame.Rect(0, i * height, gif_width, height)
-                    frame = gif.subsurface(rect).copy()
-                    frame = pygame.transform.scale(frame, size)
-                    frames.append(frame)
-                except pygame.error as e:
-                    print(f"Error extracting frame {i}: {e}")
-                    break
-        except pygame.error as e:
+            return load_gif_atlas(gif_path, size)
+        except (pygame.error, OSError, ValueError) as e:
             print(f"Failed to load GIF: {e}")
-
-        return frames
+            return None
 
     def update(self, dt):
+        if len(self.frames) > 1:
+            # Advance by the GIF's own per-frame delays; the modulo keeps a long frame spike from looping here
+            self.frame_time = (self.frame_time + dt * 1000) % self.atlas.total_duration
+            while self.frame_time >= self.durations[self.frame_index]:
+                self.frame_time -= self.durations[self.frame_index]
+                self.frame_index = (self.frame_index + 1) % len(self.frames)
+            self.image = self.frames[self.frame_index]
+
+    def advance(self, elapsed):
+        self.update(elapsed)
+
+    def snapshot(self):
+        return self.rect.topleft, self.frame_index, self.frame_time
+
+    def restore(self, state):
+        topleft, self.frame_index, self.frame_time = state
+        self.rect.topleft = topleft
+        self.previous_topleft = self.rect.topleft
         if self.frames:
-            self.frame_index += 12 * dt
-            self.frame_index %= len(self.frames)  # Ensure frame_index wraps around
-            self.image = self.frames[int(self.frame_index)]
-            self.rect = self.image.get_rect(topleft=self.rect.topleft)  # Update rect position if needed
-
-class PathBehavior:
-    def __init__(self, path, speed=300):
-        self.path = path
-        self.current_target_index = 0
-        self.speed = speed
-
-    def update(self, character, dt):
-        target_pos = pygame.math.Vector2(self.path[self.current_target_index])
-        direction = target_pos - pygame.math.Vector2(character.rect.center)
-        distance = direction.length()
-
-        if distance < 5:  # If close enough to the target, move to the next point
-            self.current_target_index = (self.current_target_index + 1) % len(self.path)
-        else:
-            character.direction = direction.normalize()
-            character.rect.center += character.direction * self.speed * dt
+            self.image = self.frames[self.frame_index]
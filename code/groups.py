@@ -1,16 +1,113 @@
+from time import perf_counter
+
 import pygame
 from settings import WINDOW_WIDTH, WINDOW_HEIGHT
+from spatial import SpatialGrid
+from lod import LodScheduler
 
 class AllSprites(pygame.sprite.Group):
     def __init__(self):
         super().__init__()
         self.display_surface = pygame.display.get_surface()
         self.offset = pygame.math.Vector2()
+        self.camera_rect = pygame.Rect(0, 0, WINDOW_WIDTH, WINDOW_HEIGHT)
+        self.grid = SpatialGrid()
+        self.lod = LodScheduler(self.grid)
+        self.profiler = None
+        self.crowds = []
+        self.world = None  # The main map layer's strips are y-sorted together with the sprites
+        self.alpha = 1.0  # How far rendering is between the previous and the current simulation step
+        self.drawn = []
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        # Sprites join the group before their rect exists; the scheduler indexes them on the next update
+        self.lod.add(sprite)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.lod.remove(sprite)
+
+    def update(self, dt):
+        sprites, steps = self.lod.schedule(dt, self.camera_rect)
+        for sprite in sprites:
+            sprite.previous_topleft = sprite.rect.topleft
+
+        if self.profiler and self.profiler.enabled:
+            self.profiled_update(sprites, steps)
+        else:
+            for sprite, step in zip(sprites, steps):
+                sprite.update(step)
+        self.refresh_grid()
+
+        for crowd in self.crowds:
+            crowd.update(dt, self.camera_rect)
+
+    def profiled_update(self, sprites, steps):
+        # Same as the plain update, but charges each sprite's cost to its class and behavior
+        profiler = self.profiler
+        for sprite, step in zip(sprites, steps):
+            start = perf_counter()
+            sprite.update(step)
+            elapsed = perf_counter() - start
+            behavior = getattr(sprite, 'behavior', None)
+            name = type(sprite).__name__
+            if behavior is not None and type(behavior).__name__ != 'Behavior':
+                name = f"{name}/{type(behavior).__name__}"
+            profiler.add(f"update {name}", elapsed)
+
+    def refresh_grid(self):
+        # Sleeping sprites don't move, so only the ones around the camera need relinking
+        grid = self.grid
+        for sprite in self.lod.awake:
+            grid.update(sprite)
+        for sprite in self.lod.always:
+            grid.update(sprite)
+
+    def render_position(self, sprite):
+        x, y = sprite.rect.topleft
+        previous = getattr(sprite, 'previous_topleft', None)
+        if previous is None or self.alpha >= 1:
+            return x, y
+        alpha = self.alpha
+        return round(previous[0] + (x - previous[0]) * alpha), round(previous[1] + (y - previous[1]) * alpha)
+
+    def layout(self):
+        # (sprite, image, screen position) for everything overlapping the viewport, back to front by their feet
+        camera_rect = self.camera_rect
+        offset_x, offset_y = -camera_rect.x, -camera_rect.y
+        render_position = self.render_position
+
+        visible = self.grid.query_rect(camera_rect)
+        for crowd in self.crowds:
+            visible.extend(crowd.visible)
+        if self.world is not None:
+            visible.extend(self.world.visible_pieces(camera_rect))
+        visible.sort(key=lambda sprite: sprite.rect.bottom)
+
+        drawn = []
+        for sprite in visible:
+            x, y = render_position(sprite)
+            drawn.append((sprite, sprite.image, (x + offset_x, y + offset_y)))
+        return drawn
+
+    def draw(self, surface, drawn=None):
+        self.drawn = self.layout() if drawn is None else drawn
+        surface.blits([(image, position) for _, image, position in self.drawn], doreturn=False)
 
-    def draw(self, surface):
-        for sprite in self.sprites():
-            # Blit each sprite with the camera offset
-            surface.blit(sprite.image, sprite.rect.topleft + self.offset)
+    def changed_rects(self, drawn):
+        # Screen rects where drawn differs from what the last draw put on screen
+        previous = {sprite: (image, position) for sprite, image, position in self.drawn}
+        rects = []
+        for sprite, image, position in drawn:
+            before = previous.pop(sprite, None)
+            if before is not None and before[0] is image and before[1] == position:
+                continue
+            rects.append(image.get_rect(topleft=position))
+            if before is not None:
+                rects.append(before[0].get_rect(topleft=before[1]))
+        rects.extend(image.get_rect(topleft=position) for image, position in previous.values())
+        return rects
 
     def set_camera(self, player_rect, world_rect):
         # Calculate the camera position
@@ -24,3 +121,4 @@ class AllSprites(pygame.sprite.Group):
         camera_y = min(camera_y, 0)
 
         self.offset = pygame.math.Vector2(camera_x, camera_y)
+        self.camera_rect.topleft = (-camera_x, -camera_y)
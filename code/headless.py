@@ -0,0 +1,76 @@
+import pygame
+
+FIXED_DT = 1 / 60
+
+
+class ScriptedKeys:
+    # Stands in for pygame.key.get_pressed() so Character.input sees the scripted held keys
+    def __init__(self):
+        self.held = set()
+
+    def __getitem__(self, key):
+        return key in self.held
+
+
+class InputScript:
+    def __init__(self):
+        self.taps = {}
+        self.holds = []
+
+    def tap(self, frame, key):
+        self.taps.setdefault(frame, []).append(key)
+        return self
+
+    def hold(self, frame, keys, duration):
+        self.holds.append((frame, frame + duration, tuple(keys)))
+        return self
+
+    def apply(self, frame, scripted_keys):
+        scripted_keys.held.clear()
+        for start, end, keys in self.holds:
+            if start <= frame < end:
+                scripted_keys.held.update(keys)
+        return [pygame.event.Event(pygame.KEYDOWN, key=key) for key in self.taps.get(frame, ())]
+
+    @property
+    def length(self):
+        return max([end for _, end, _ in self.holds] + [frame + 1 for frame in self.taps] + [0])
+
+
+def default_script():
+    # Walk, sprint and super sprint, page through dialogue, then hand the camera between all three interns
+    script = InputScript()
+    script.hold(0, [pygame.K_d], 60)
+    script.hold(60, [pygame.K_s, pygame.K_LSHIFT], 60)
+    script.hold(120, [pygame.K_s, pygame.K_LSHIFT, pygame.K_SPACE], 30)
+    script.tap(160, pygame.K_e)
+    for frame in (180, 200, 220):
+        script.tap(frame, pygame.K_RETURN)
+    script.tap(240, pygame.K_r)
+    script.tap(260, pygame.K_2)
+    script.hold(270, [pygame.K_a], 60)
+    script.tap(340, pygame.K_3)
+    script.tap(360, pygame.K_e)
+    script.hold(380, [pygame.K_w, pygame.K_RSHIFT], 60)
+    script.tap(450, pygame.K_1)
+    script.hold(460, [pygame.K_d, pygame.K_w], 40)
+    return script
+
+
+class HeadlessRunner:
+    def __init__(self, game, script=None, dt=FIXED_DT):
+        self.game = game
+        self.script = script if script is not None else default_script()
+        self.dt = dt
+        self.keys = ScriptedKeys()
+        self.frame_count = 0
+        game.get_pressed = lambda: self.keys
+
+    def run(self, frames):
+        # The script loops, so long runs keep exercising the same mix of input.
+        # Enable game.profiler beforehand to collect per-stage timings.
+        for _ in range(frames):
+            events = self.script.apply(self.frame_count % max(self.script.length, 1), self.keys)
+            pygame.event.pump()
+            self.frame_count += 1
+            self.game.frame(self.dt, events)
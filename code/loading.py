@@ -0,0 +1,21 @@
+import pygame
+from settings import COLORS
+from dialogue import get_font, draw_rounded_rect
+
+
+class LoadingScreen:
+    def __init__(self, size, font_size=36):
+        self.rect = pygame.Rect((0, 0), size)
+        self.font = get_font(None, font_size)
+
+    def draw(self, surface, label, progress):
+        surface.fill(COLORS['dark'])
+        bar = pygame.Rect(0, 0, self.rect.width // 2, 24)
+        bar.center = self.rect.center
+        draw_rounded_rect(surface, COLORS['gray'], bar, 12)
+        if progress > 0:
+            filled = bar.copy()
+            filled.width = max(int(bar.width * min(progress, 1)), 24)
+            draw_rounded_rect(surface, COLORS['blue'], filled, 12)
+        text = self.font.render(label, True, COLORS['white'])
+        surface.blit(text, text.get_rect(midbottom=(bar.centerx, bar.top - 16)))
@@ -0,0 +1,114 @@
+LOD_VIEW_MARGIN = 128  # Sprites this close to the camera update every tick
+LOD_NEAR_MARGIN = 640  # Out to here they update every LOD_NEAR_INTERVAL ticks, with the skipped time added up
+LOD_NEAR_INTERVAL = 4
+
+
+class LodScheduler:
+    # Decides which sprites update this tick and with what dt. Sprites beyond the near band sleep untouched,
+    # so a tick costs in proportion to what is around the camera; on waking they are advanced by the
+    # time they slept through their advance(elapsed) method when they have one.
+    def __init__(self, grid, view_margin=LOD_VIEW_MARGIN, near_margin=LOD_NEAR_MARGIN,
+                 near_interval=LOD_NEAR_INTERVAL):
+        self.grid = grid
+        self.view_margin = view_margin
+        self.near_margin = near_margin
+        self.near_interval = near_interval
+        self.clock = 0.0
+        self.tick = 0
+        self.fresh = []
+        self.always = {}  # Sprites that are never slowed down (the interns), in the order they were added
+        self.awake = set()
+        self.spare = set()  # Last tick's awake set, cleared and reused so a tick builds no new containers
+        self.sprites = []  # What schedule() returns: the sprites to update and, in steps, the dt each gets
+        self.steps = []
+        self.pending = {}  # Time near sprites have skipped since their last update
+        self.asleep_at = {}
+        self.phases = {}
+
+    def add(self, sprite):
+        # Sprites are added before their constructors finish, so they are sorted out on the next tick
+        self.fresh.append(sprite)
+
+    def remove(self, sprite):
+        self.always.pop(sprite, None)
+        self.awake.discard(sprite)
+        self.pending.pop(sprite, None)
+        self.asleep_at.pop(sprite, None)
+        self.phases.pop(sprite, None)
+        self.grid.remove(sprite)
+
+    def reset(self):
+        # Sprites were moved wholesale, e.g. by restoring a snapshot: nothing is owed any catch-up time
+        self.awake.clear()
+        self.pending.clear()
+        for sprite in self.phases:
+            self.asleep_at[sprite] = self.clock
+            self.grid.update(sprite)
+        for sprite in self.always:
+            self.grid.update(sprite)
+
+    def admit(self, sprite):
+        if not sprite.alive():
+            return
+        self.grid.insert(sprite)
+        if getattr(sprite, 'is_npc', True) is False:
+            self.always[sprite] = None
+        else:
+            # Spread the near band's updates evenly over the interval
+            self.phases[sprite] = len(self.phases) % self.near_interval
+            self.asleep_at[sprite] = self.clock
+
+    def schedule(self, dt, camera_rect):
+        # Fills self.sprites and self.steps with what to update this tick and the dt to use; sleeping sprites
+        # that come back into range are advanced first
+        self.clock += dt
+        self.tick += 1
+        if self.fresh:
+            for sprite in self.fresh:
+                self.admit(sprite)
+            self.fresh.clear()
+
+        view_rect = camera_rect.inflate(self.view_margin * 2, self.view_margin * 2)
+        near_rect = camera_rect.inflate(self.near_margin * 2, self.near_margin * 2)
+        always, pending, asleep_at = self.always, self.pending, self.asleep_at
+        tick, interval = self.tick, self.near_interval
+
+        sprites, steps = self.sprites, self.steps
+        sprites.clear()
+        steps.clear()
+        awake = self.spare
+        awake.clear()
+        for sprite in self.grid.query_rect(near_rect):
+            if sprite in always:
+                continue
+            awake.add(sprite)
+            slept_since = asleep_at.pop(sprite, None)
+            if slept_since is not None:
+                advance = getattr(sprite, 'advance', None)
+                elapsed = self.clock - dt - slept_since
+                if advance is not None and elapsed > 0:
+                    advance(elapsed)
+                pending[sprite] = 0.0
+
+            if view_rect.colliderect(sprite.rect):
+                sprites.append(sprite)
+                steps.append(pending[sprite] + dt)
+                pending[sprite] = 0.0
+            else:
+                pending[sprite] += dt
+                if (tick + self.phases[sprite]) % interval == 0:
+                    sprites.append(sprite)
+                    steps.append(pending[sprite])
+                    pending[sprite] = 0.0
+
+        for sprite in self.awake:
+            if sprite not in awake:
+                # Time it had skipped but not yet simulated counts as asleep too
+                asleep_at[sprite] = self.clock - pending.pop(sprite, 0.0)
+        self.spare = self.awake
+        self.awake = awake
+
+        for sprite in always:
+            sprites.append(sprite)
+            steps.append(dt)
+        return sprites, steps
@@ -1,167 +1,182 @@
 import os
+import sys
+import time
+
+STARTED = time.perf_counter()  # Before the heavy imports, so startup timings include them
+
 import pygame
 import asyncio
-import pygbag
-from settings import WINDOW_WIDTH, WINDOW_HEIGHT
-from entities import Character, GifAnimation
+if sys.platform == 'emscripten':
+    import pygbag  # Web-only; desktop runs never need it
+from settings import WINDOW_WIDTH, WINDOW_HEIGHT, TILE_SIZE, RENDER_FPS, SIMULATION_DT, MAX_SIMULATION_STEPS, AMBIENT_NPCS
+from settings import DIRTY_RECTS, DIRTY_MAX_RECTS, DIRTY_MAX_AREA, WORLD_STREAMING, PRESENCE_SERVER
+from settings import DOUBLE_TAP_TIME, SPEECH_BUBBLE_TIMEOUT, RENDER_BACKEND
+from entities import Character
 from groups import AllSprites
-from support import all_character_import
-from npc_behaviors import PathBehavior, WanderBehavior
+from world import LayeredWorld, load_world_layers
+from regions import RegionStore, StreamedGround
+from dialogue import DialogueRenderer
+from profiler import Profiler, ProfilerOverlay
+from support import CharacterFrames, all_character_import
+from scene import SCENES_DIR, load_scene
+from pathfinding import Pathfinder, load_walkability
+from collision import CollisionMap, HITBOX_SIZE
+from loading import LoadingScreen
+from snapshot import read_checkpoint, write_checkpoint
+from timers import Timers
+from render import create_backend
 
 base_dir = os.path.dirname(os.path.abspath(__file__))
 base_dir = os.path.dirname(base_dir)
-TILE_SIZE = 32
+WORLD_IMAGE_PATH = os.path.join(base_dir, 'assets', 'graphics', 'map', 'world.png')
+CHECKPOINT_PATH = os.path.join(base_dir, 'checkpoint.bin')
 
 class Game:
-    def __init__(self):
+    def __init__(self, headless=False, deferred=False, backend=None):
+        if headless:
+            # The dummy drivers need no display or sound card, so the game can be driven from CI
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            os.environ['SDL_AUDIODRIVER'] = 'dummy'
         pygame.init()
-        self.display_surface = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-        pygame.display.set_caption("NGINX Game")
+        self.headless = headless
+        # Everything is drawn onto self.renderer, a render.SurfaceBackend or TextureBackend
+        self.renderer = create_backend(backend or RENDER_BACKEND, (WINDOW_WIDTH, WINDOW_HEIGHT), "NGINX Game")
+        self.display_surface = self.renderer.surface  # None when drawing through textures
         self.clock = pygame.time.Clock()
-        self.setup()
+        self.dialogue = DialogueRenderer()
+        self.profiler = Profiler()
+        self.profiler_overlay = ProfilerOverlay(self.profiler)
+        self.get_pressed = pygame.key.get_pressed
+        self.ticks = 0
+        self.timers = Timers()  # Runs on simulation time; see update()
+        self.double_taps = {}  # Key -> the timer that forgets its first press
+        self.render_fps = RENDER_FPS
+        self.accumulator = 0.0
+        self.camera_focus = pygame.Rect(0, 0, 1, 1)
+        self.dirty_rendering = DIRTY_RECTS
+        self.startup = {}  # Seconds from STARTED to 'first_frame', 'loaded' and 'first_game_frame'
+        self.on_startup = None  # Called with self.startup once the first game frame is on screen
+        self.loaded = False
+        self.regions = None
+        self.world_image = None
+        self.initial_state = None  # What ESC goes back to, taken when setup finishes
+        self.checkpoint = None
+        self.presence = None  # A presence.PresenceClient once joined to a shared office
+        if not deferred:
+            # Deferred games are loaded by run(), a stage at a time behind a progress screen
+            self.setup()
 
     def import_assets(self):
-        # Adjust base_dir to point to the correct location
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        base_dir = os.path.dirname(base_dir)  # Go one level up if needed
-
-        print(f"Base directory: {base_dir}")
-        try:
-            self.world_image_path = os.path.join(base_dir, 'assets', 'graphics', 'map', 'world.png')
-            self.world_image = pygame.image.load(self.world_image_path).convert_alpha()
-            print(f"Loaded world image from: {self.world_image_path}")
-        except pygame.error as e:
-            print(f"Failed to load world image: {e}")
-
-        try:
-            self.gif1_path = os.path.join(base_dir,  'assets', 'graphics', 'gifs', 'f5logo.gif')
-            print(f"Loading GIF1 from: {self.gif1_path}")
-        except pygame.error as e:
-            print(f"Failed to load GIF1: {e}")
-
-        # Update paths for GIFs
-        self.gif1_path = os.path.join(base_dir,  'assets', 'graphics', 'gifs', 'f5logo.gif')
-        print(f"Loading GIF1 from: {self.gif1_path}")
-        # Repeat for other GIFs
-        # Repeat for other GIFs Move up one level if necessary
-        self.overworld_frames = {
-            'characters': all_character_import(base_dir,  'assets','graphics', 'characters')
-        }
+        # Survives restarts; the character sheets load lazily on first use
+        if not hasattr(self, 'overworld_frames'):
+            self.overworld_frames = {
+                'characters': all_character_import(base_dir, 'assets', 'graphics', 'characters')
+            }
 
-        self.world_image_path = os.path.join(base_dir, 'assets', 'graphics', 'map', 'world.png')
-        try:
-            self.world_image = pygame.image.load(self.world_image_path).convert_alpha()
-        except pygame.error as e:
-            print(f"Failed to load world image: {e}")
+    def build_world(self):
+        # A flat map is streamed from region files when it can be; layered maps are baked whole.
+        # Either way the decoded map survives restarts.
+        layers = load_world_layers(base_dir)
+        if WORLD_STREAMING and not layers:
+            try:
+                if self.regions is None:
+                    self.regions = RegionStore.open(WORLD_IMAGE_PATH)
+                return LayeredWorld(layers, ground=StreamedGround(self.regions))
+            except (OSError, ValueError) as e:
+                print(f"Map streaming disabled: {e}")
+                self.regions = None
+        if not layers:
+            if self.world_image is None:
+                self.world_image = pygame.image.load(WORLD_IMAGE_PATH).convert_alpha()
+            layers['bg'] = self.world_image
+        return LayeredWorld(layers)
 
     def setup(self):
+        for _ in self.setup_stages():
+            pass
+
+    def setup_stages(self):
+        # Yields (label, progress) before each slow step so load() can show progress and yield in between
+        self.loaded = False
+        yield "Loading the map", 0.0
+        self.timers.clear()
+        self.double_taps.clear()
         self.all_sprites = AllSprites()
+        self.all_sprites.profiler = self.profiler
         self.import_assets()
 
-        self.world_rect = self.world_image.get_rect()
-        self.test_surface = pygame.Surface(self.world_rect.size)
-        self.test_surface.blit(self.world_image, (0, 0))
-
-        gif1_path = os.path.join(base_dir, 'assets', 'graphics', 'gifs', 'f5logo.gif')
-        gif1_size = (52, 32)
-        gif1_pos = (TILE_SIZE * 40.2, TILE_SIZE * 30.5)
-        self.gif1_animation = GifAnimation(gif1_pos, gif1_path, gif1_size, self.all_sprites)
-
-        gif2_path = os.path.join(base_dir, 'assets', 'graphics', 'gifs', 'scroll.gif')
-        gif2_size = (52, 32)
-        gif2_pos = (TILE_SIZE * 46.2, TILE_SIZE * 30.5)
-        self.gif2_animation = GifAnimation(gif2_pos, gif2_path, gif2_size, self.all_sprites)
-
-        gif3_path = os.path.join(base_dir, 'assets', 'graphics', 'gifs', 'nginxlogo.gif')
-        gif3_size = (52, 32)
-        gif3_pos = (TILE_SIZE * 40.2, TILE_SIZE * 40.5)
-        self.gif3_animation = GifAnimation(gif3_pos, gif3_path, gif3_size, self.all_sprites)
-
-        gif4_path = os.path.join(base_dir, 'assets', 'graphics', 'gifs', 'ogbluescreen.gif')
-        gif4_size = (52, 32)
-        gif4_pos = (TILE_SIZE * 46.2, TILE_SIZE * 40.5)
-        self.gif4_animation = GifAnimation(gif4_pos, gif4_path, gif4_size, self.all_sprites)
-
-        alex_dialogs = [
-            "Hi, I'm Alex! An Engineering Intern at F5/NGINX!",
-            "Since a young age, I loved to tinker and mod software!",
-            "I'm on the NGINX Ingress Controller Team.",
-            "My biggest additions is on IP listener and Telemetry.",
-            "Oh wait! I need to go to the conference room!"
-        ]
-
-        spencer_dialogs = [
-            "My name Spencer and I'm an Intern at F5/NGINX",
-            "I'm on the NGINX Agent Team.",
-            "I've had the chance to work on some interesting projects.",
-            "And this is how we navigate through F5 as interns!"
-        ]
-
-        stephen_dialogs = [
-            "Hey, I'm Stephen, another engineering intern at f5/NGINX.",
-            "Graduating this year from Munster Technological University",
-            "My experience at NGINX/F5 has been like no other",
-            "Im on the delivery eng. team, under Sergey nad my buddy Sean!",
-            "Ive worked on some interesting/challenging projects",
-            "I'm late! The lads are waiting in the conference room"
-        ]
-
-        self.alex = Character((TILE_SIZE * 34, TILE_SIZE * 20), self.overworld_frames['characters']['alex'],
-                              self.all_sprites, self.world_rect, alex_dialogs)
-        self.spencer = Character((TILE_SIZE * 37, TILE_SIZE * 52), self.overworld_frames['characters']['spencer'],
-                                 self.all_sprites, self.world_rect, spencer_dialogs)
-        self.stephen = Character((TILE_SIZE * 13, TILE_SIZE * 46), self.overworld_frames['characters']['stephen'],
-                                 self.all_sprites, self.world_rect, stephen_dialogs)
-
-        npc_paths = {
-            'moving_character': [
-                (TILE_SIZE * 18, TILE_SIZE * 8),
-                (TILE_SIZE * 35, TILE_SIZE * 10),
-                (TILE_SIZE * 35, TILE_SIZE * 100),
-                (TILE_SIZE * 18, TILE_SIZE * 100),
-                (TILE_SIZE * 18, TILE_SIZE * 8),
-            ]
-        }
-
-        self.npc1 = Character((TILE_SIZE * 11, TILE_SIZE * 36), self.overworld_frames['characters']['blond'],
-                              self.all_sprites, self.world_rect, ["I'm NPC1!"], is_npc=True)
-        self.npc2 = Character((TILE_SIZE * 11, TILE_SIZE * 16), self.overworld_frames['characters']['hat_girl'],
-                              self.all_sprites, self.world_rect, ["I'm NPC2!"], is_npc=True)
-        self.npc3 = Character((TILE_SIZE * 47, TILE_SIZE * 26), self.overworld_frames['characters']['purple_girl'],
-                              self.all_sprites, self.world_rect, ["I'm NPC3!"], is_npc=True)
-        self.npc4 = Character((TILE_SIZE * 11, TILE_SIZE * 56), self.overworld_frames['characters']['straw'],
-                              self.all_sprites, self.world_rect, ["I'm NPC3!"], is_npc=True)
-        self.npc5 = Character((TILE_SIZE * 41, TILE_SIZE * 46), self.overworld_frames['characters']['grass_boss'],
-                              self.all_sprites, self.world_rect, ["I'm NPC3!"], is_npc=True)
-
-        self.moving_character = Character(
-            (TILE_SIZE * 18, TILE_SIZE * 8),
-            self.overworld_frames['characters']['npc1'],
-            self.all_sprites,
-            self.world_rect,
-            is_npc=True
-        )
-        path_behavior = PathBehavior(npc_paths['moving_character'])
-        self.moving_character.set_behavior(path_behavior)
-
-        self.current_character = self.alex
-        self.alex.current_character = self.alex
-        self.camera_target = self.alex
+        yield "Building the world", 0.2
+        self.world = self.build_world()
+        self.world_rect = self.world.rect
+        self.all_sprites.world = self.world
+        if getattr(self, 'pathfinder', None) is None:
+            yield "Mapping the office", 0.4
+            # Kept across restarts along with its path cache
+            if self.regions is not None:
+                grid = load_walkability(base_dir, grid=self.regions.walkability_grid())
+            else:
+                grid = load_walkability(base_dir, self.world_image)
+            self.pathfinder = Pathfinder(grid, footprint=HITBOX_SIZE)
+            self.collision_map = CollisionMap(self.pathfinder.grid)
+
+        yield "Loading the scene", 0.6
+        self.scene = load_scene(os.path.join(SCENES_DIR, 'office.json'))
+        self.entities = self.scene.spawn_always(self)
+        self.interns = [self.entities[name] for name in self.scene.interns]
+
+        yield "Meeting the interns", 0.8
+        self.current_character = self.entities[self.scene.player]
+        self.current_character.current_character = self.current_character
+        self.camera_target = self.current_character
+        self.update_camera()
+        self.entities.update(self.scene.stream(self.all_sprites.camera_rect, self))
+
+        self.crowd = None
+        if AMBIENT_NPCS:
+            self.spawn_crowd(AMBIENT_NPCS)
+
+        characters = [sprite for sprite in self.all_sprites if isinstance(sprite, Character)]
+        for character in characters:
+            character.collision_map = self.collision_map
+            character.pathfinder = self.pathfinder
+        self.evict_sheets()
+
+        self.dialogue.clear()
+        self.dialogue.prerender(characters)
+        self.last_view = None  # Forces a full redraw
+        self.bubble_drawn = None
+        self.initial_state = self.snapshot()
+        self.loaded = True
+        self.mark_startup('loaded')
+        yield "Ready", 1.0
+
+    async def load(self):
+        screen = LoadingScreen(self.renderer.get_size())
+        for label, progress in self.setup_stages():
+            pygame.event.pump()
+            screen.draw(self.renderer, label, progress)
+            self.renderer.present()
+            self.mark_startup('first_frame')
+            await asyncio.sleep(0)  # Lets the browser put the progress on screen before the next stage
+
+    def mark_startup(self, milestone):
+        if milestone in self.startup:
+            return
+        self.startup[milestone] = time.perf_counter() - STARTED
+        if milestone == 'first_game_frame':
+            if not self.headless:
+                print("Startup: " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.startup.items()))
+            if self.on_startup:
+                self.on_startup(self.startup)
 
     def switch_character(self, new_character):
         if new_character == self.current_character:
             return
 
         if self.current_character:
-            target_positions = {
-                self.alex: (TILE_SIZE * 31, TILE_SIZE * 109),
-                self.spencer: (TILE_SIZE * 29, TILE_SIZE * 110),
-                self.stephen: (TILE_SIZE * 27, TILE_SIZE * 111)
-            }
-
-            target_position = target_positions.get(self.current_character, None)
+            target_position = self.current_character.meeting_point
             if target_position:
-                self.current_character.move_to(target_position)
+                self.send_to(self.current_character, target_position)
                 self.facing_direction = 'down'
 
         self.current_character = new_character
@@ -190,108 +205,362 @@ class Game:
             self.camera_target = new_character
             self.all_sprites.set_camera(new_character.rect, self.world_rect)
 
+    def send_to(self, character, target_position):
+        # Walk around walls when a route exists, otherwise fall back to the old straight line
+        def on_path(waypoints):
+            if waypoints:
+                character.follow_path(waypoints)
+            else:
+                character.move_to(target_position)
+
+        character.plan_route(target_position, on_path)
+
+    def spawn_crowd(self, count, sheets=('blond', 'hat_girl', 'purple_girl', 'straw', 'npc1'), seed=None):
+        from crowd import Crowd  # Pulls in numpy, so only imported when a crowd is wanted
+        try:
+            crowd = Crowd(self.world_rect, seed=seed)
+        except RuntimeError as e:
+            print(f"Ambient crowd disabled: {e}")
+            return None
+        frame_sets = [self.overworld_frames['characters'][sheet] for sheet in sheets]
+        crowd.populate(count, frame_sets, self.world_rect.inflate(-TILE_SIZE * 4, -TILE_SIZE * 4), seed)
+        self.all_sprites.crowds.append(crowd)
+        self.crowd = crowd
+        return crowd
+
+    def stream_scene(self):
+        spawned = self.scene.stream(self.all_sprites.camera_rect, self)
+        if spawned:
+            self.entities.update(spawned)
+            self.dialogue.prerender([entity for entity in spawned.values() if isinstance(entity, Character)])
+
+    def characters_near(self, position, radius):
+        return [sprite for sprite in self.all_sprites.grid.query_radius(position, radius)
+                if isinstance(sprite, Character)]
+
+    def entity_name(self, entity):
+        return next((name for name, candidate in self.entities.items() if candidate is entity), None)
+
+    def snapshot(self):
+        # The simulation state as plain data: what each named entity is doing, which scene regions have
+        # spawned, who is played and followed, and the ambient crowd. Assets and the world aren't part of it.
+        return {
+            'ticks': self.ticks,
+            'regions': sorted(self.scene.spawned),
+            'entities': {name: entity.snapshot() for name, entity in self.entities.items() if entity.alive()},
+            'player': self.entity_name(self.current_character),
+            'camera_target': self.entity_name(self.camera_target),
+            'bubbles': [name for name, entity in self.entities.items() if getattr(entity, 'speech_bubble', None)],
+            'crowd': self.crowd.snapshot() if self.crowd else None,
+        }
+
+    def restore(self, state):
+        # Puts the running game back to a snapshot in place, reusing every sprite, asset and cache it can
+        entities = state['entities']
+        for name, entity in list(self.entities.items()):
+            if name not in entities:
+                entity.kill()
+                del self.entities[name]
+        spawned = self.scene.restore(state['regions'], self)
+        for entity in spawned.values():
+            if isinstance(entity, Character):
+                entity.collision_map = self.collision_map
+                entity.pathfinder = self.pathfinder
+        self.entities.update(spawned)
+        self.dialogue.prerender([entity for entity in spawned.values() if isinstance(entity, Character)])
+
+        for name, entity_state in entities.items():
+            self.entities[name].restore(entity_state)
+        self.pathfinder.cancel()
+        self.all_sprites.lod.reset()
+        if self.crowd and state['crowd']:
+            self.crowd.restore(state['crowd'])
+
+        self.ticks = state['ticks']
+        for timer in self.double_taps.values():
+            timer.cancel()
+        self.double_taps.clear()
+        self.accumulator = 0.0
+        self.current_character = self.entities[state['player']]
+        self.camera_target = self.entities[state['camera_target']]
+        for name in state['bubbles']:
+            self.entities[name].show_speech_bubble(self.dialogue.bubble(self.entities[name]), SPEECH_BUBBLE_TIMEOUT)
+        self.update_camera()
+        self.last_view = None
+        self.bubble_drawn = None
+        self.evict_sheets()
+
+    def evict_sheets(self):
+        # Frees every character sheet no live sprite is drawn from: after setup, a restore or visitors leaving.
+        # Sheets come back lazily, and scene streaming prefetches them ahead of the camera.
+        sprites = list(self.all_sprites)
+        if self.crowd:
+            sprites.extend(self.crowd.sprites)
+        keep = {sprite.frames.name for sprite in sprites if isinstance(getattr(sprite, 'frames', None), CharacterFrames)}
+        self.overworld_frames['characters'].evict(keep)
+
     def restart_game(self):
-        self.setup()
+        if self.initial_state is None:
+            self.setup()
+        else:
+            self.restore(self.initial_state)
         print("Game restarted.")
 
+    def save_checkpoint(self, path=CHECKPOINT_PATH):
+        self.checkpoint = self.snapshot()
+        try:
+            write_checkpoint(path, self.checkpoint)
+        except OSError as e:
+            # Still kept in memory for this session
+            print(f"Could not write checkpoint {path}: {e}")
+            return False
+        return True
+
+    def load_checkpoint(self, path=CHECKPOINT_PATH):
+        state = self.checkpoint
+        if state is None:
+            try:
+                state = read_checkpoint(path)
+            except (OSError, ValueError) as e:
+                print(f"No checkpoint to load: {e}")
+                return False
+        try:
+            self.restore(state)
+        except (KeyError, ValueError) as e:
+            # Written for a different scene or crowd: start over rather than run half restored
+            print(f"Could not load checkpoint: {e}")
+            self.restart_game()
+            return False
+        self.checkpoint = state
+        return True
+
+    def handle_event(self, event):
+        if event.type == pygame.QUIT:
+            return False
+        if event.type == pygame.KEYDOWN:
+            key = event.key
+            if key in [pygame.K_1, pygame.K_2, pygame.K_3]:
+                first_press = self.double_taps.pop(key, None)
+                if first_press is not None:
+                    first_press.cancel()
+                    self.current_character.stop_moving = not self.current_character.stop_moving
+                else:
+                    self.double_taps[key] = self.timers.after(DOUBLE_TAP_TIME, self.double_taps.pop, key, None)
+                    index = key - pygame.K_1
+                    if index < len(self.interns):
+                        self.switch_character(self.interns[index])
+            elif key == pygame.K_e:
+                if self.current_character.speech_bubble is None:
+                    self.current_character.show_speech_bubble(self.dialogue.bubble(self.current_character),
+                                                              SPEECH_BUBBLE_TIMEOUT)
+            elif key == pygame.K_RETURN:
+                if self.current_character.speech_bubble:
+                    self.current_character.next_dialog()
+                    self.current_character.show_speech_bubble(self.dialogue.bubble(self.current_character),
+                                                              SPEECH_BUBBLE_TIMEOUT)
+            elif key == pygame.K_f:
+                for character in self.interns:
+                    print_character_location(character)
+            elif key == pygame.K_r:
+                if self.current_character.speech_bubble:
+                    self.current_character.hide_speech_bubble()
+            elif key == pygame.K_ESCAPE:
+                self.restart_game()
+            elif key == pygame.K_F3:
+                self.profiler_overlay.toggle()
+            elif key == pygame.K_F4:
+                print(f"Profile written to {self.export_profile()}")
+            elif key == pygame.K_F5:
+                if self.save_checkpoint():
+                    print("Checkpoint saved.")
+            elif key == pygame.K_F9:
+                if self.load_checkpoint():
+                    print("Checkpoint loaded.")
+        return True
+
+    def export_profile(self, path=None):
+        if path is None:
+            path = os.path.join(base_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        return self.profiler.export(path)
+
+    def process_input(self):
+        if self.current_character and not self.current_character.stop_moving:
+            self.current_character.input(self.get_pressed())
+
+    def update(self, dt):
+        self.ticks += dt * 1000
+        # Only the timers that come due run: NPC bobbing, bubble timeouts, double taps
+        self.timers.advance(dt * 1000)
+        if self.dialogue.pending:
+            self.dialogue.pump()
+
+        self.all_sprites.update(dt)
+        if self.presence:
+            self.presence.sync(dt)
+
+    def simulate(self, dt):
+        # Fixed-size steps keep movement and behaviors independent of the render rate
+        self.accumulator += dt
+        steps = 0
+        while self.accumulator >= SIMULATION_DT:
+            if steps == MAX_SIMULATION_STEPS:
+                # Too far behind to catch up: drop the backlog instead of spiralling
+                self.accumulator = 0.0
+                break
+            with self.profiler.stage('input'):
+                self.process_input()
+            with self.profiler.stage('update'):
+                self.update(SIMULATION_DT)
+            self.accumulator -= SIMULATION_DT
+            steps += 1
+        self.all_sprites.alpha = self.accumulator / SIMULATION_DT
+        return steps
+
+    def update_camera(self):
+        if self.camera_target:
+            # Follow where the target is drawn, not where it is simulated, so the camera doesn't jitter
+            x, y = self.all_sprites.render_position(self.camera_target)
+            self.camera_focus.size = self.camera_target.rect.size
+            self.camera_focus.topleft = (x, y)
+            self.all_sprites.set_camera(self.camera_focus, self.world_rect)
+
+    def draw_world(self):
+        if not self.world_rect.contains(self.all_sprites.camera_rect):
+            self.renderer.fill((0, 0, 0))
+        self.world.draw(self.renderer, self.all_sprites.camera_rect)
+
+    def draw_sprites(self):
+        self.all_sprites.draw(self.renderer)
+        self.world.draw_top(self.renderer, self.all_sprites.camera_rect)
+
+    def bubble_layout(self):
+        if self.current_character.speech_bubble:
+            x, y = self.all_sprites.render_position(self.current_character)
+            bubble_x = x + self.current_character.rect.width // 2 - self.current_character.speech_bubble.get_width() // 2
+            bubble_y = y - self.current_character.speech_bubble.get_height() - 10
+            bubble_position = (int(bubble_x + self.all_sprites.offset.x), int(bubble_y + self.all_sprites.offset.y))
+            return self.current_character.speech_bubble, bubble_position
+        return None
+
+    def draw_bubble(self, bubble=None):
+        self.bubble_drawn = self.bubble_layout() if bubble is None else bubble
+        if self.bubble_drawn:
+            self.renderer.blit(*self.bubble_drawn)
+
+    def present(self):
+        self.renderer.present()
+
+    def dirty_rects(self):
+        # Everything that moved, animated or changed bubble since the last frame, merged where they overlap
+        drawn = self.all_sprites.layout()
+        bubble = self.bubble_layout()
+        rects = self.all_sprites.changed_rects(drawn)
+        if bubble != self.bubble_drawn:
+            for layout in (bubble, self.bubble_drawn):
+                if layout is not None:
+                    rects.append(layout[0].get_rect(topleft=layout[1]))
+
+        screen_rect = self.renderer.get_rect()
+        merged = []
+        for rect in rects:
+            rect = rect.clip(screen_rect)
+            if not rect.width or not rect.height:
+                continue
+            overlapping = rect.collidelistall(merged)
+            while overlapping:
+                for index in reversed(overlapping):
+                    rect.union_ip(merged.pop(index))
+                overlapping = rect.collidelistall(merged)
+            merged.append(rect)
+        return drawn, bubble, merged
+
+    def draw_dirty(self):
+        # Returns the rects to present, or None when so much changed that a full redraw is cheaper
+        drawn, bubble, rects = self.dirty_rects()
+        if len(rects) > DIRTY_MAX_RECTS or sum(rect.width * rect.height for rect in rects) > DIRTY_MAX_AREA:
+            return None
+        surface = self.renderer
+        camera_rect = self.all_sprites.camera_rect
+        for rect in rects:
+            surface.set_clip(rect)
+            self.world.draw(surface, camera_rect)
+            self.all_sprites.draw(surface, drawn)
+            self.world.draw_top(surface, camera_rect)
+            self.draw_bubble(bubble)
+        surface.set_clip(None)
+        # The last draw may not have run when nothing changed
+        self.all_sprites.drawn = drawn
+        self.bubble_drawn = bubble
+        return rects
+
+    def frame(self, dt, events):
+        profiler = self.profiler
+        with profiler.stage('events'):
+            for event in events:
+                if not self.handle_event(event):
+                    return False
+
+        if self.pathfinder.pending:
+            with profiler.stage('pathfinding'):
+                self.pathfinder.pump()
+        self.simulate(dt)
+        with profiler.stage('camera'):
+            self.update_camera()
+            self.stream_scene()
+        # The overlay redraws every frame, so it always takes the full path
+        view = self.all_sprites.camera_rect.topleft
+        rects = None
+        if (self.dirty_rendering and self.renderer.partial_updates and view == self.last_view
+                and not self.profiler_overlay.visible):
+            with profiler.stage('sprites'):
+                rects = self.draw_dirty()
+        if rects is not None:
+            with profiler.stage('flip'):
+                if rects:
+                    self.renderer.present(rects)
+        else:
+            with profiler.stage('world'):
+                self.draw_world()
+            with profiler.stage('sprites'):
+                self.draw_sprites()
+            with profiler.stage('bubble'):
+                self.draw_bubble()
+            self.profiler_overlay.draw(self.renderer)
+            with profiler.stage('flip'):
+                self.present()
+        self.last_view = view
+
+        if profiler.enabled:
+            profiler.end_frame()
+        if 'first_game_frame' not in self.startup:
+            self.mark_startup('first_frame')
+            self.mark_startup('first_game_frame')
+        return True
+
+    async def join(self, address, sheet=None):
+        from presence import PresenceClient  # Only multiplayer sessions need the networking
+        host, _, port = address.rpartition(':')
+        client = PresenceClient(self)
+        try:
+            await client.connect(host or '127.0.0.1', int(port), sheet or self.current_character.frames.name)
+        except (OSError, ValueError, ConnectionError, asyncio.IncompleteReadError) as e:
+            print(f"Could not join {address}, playing alone: {e}")
+            return None
+        self.presence = client
+        return client
+
     async def run(self):
-        keypresses = {}
+        if not self.loaded:
+            await self.load()
+        if PRESENCE_SERVER and self.presence is None:
+            await self.join(PRESENCE_SERVER)
         while True:
-            dt = self.clock.tick(60) / 1000
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    return  # Exit the loop instead of using exit()
-                if event.type == pygame.KEYDOWN:
-                    key = event.key
-                    if key in [pygame.K_1, pygame.K_2, pygame.K_3]:
-                        if key in keypresses and pygame.time.get_ticks() - keypresses[key] < 500:
-                            self.current_character.stop_moving = not self.current_character.stop_moving
-                        else:
-                            keypresses[key] = pygame.time.get_ticks()
-                            if key == pygame.K_1:
-                                self.switch_character(self.alex)
-                            elif key == pygame.K_2:
-                                self.switch_character(self.spencer)
-                            elif key == pygame.K_3:
-                                self.switch_character(self.stephen)
-                    elif key == pygame.K_e:
-                        dialogue = self.current_character.interact()
-                        if self.current_character.speech_bubble is None:
-                            bubble_width, bubble_height = 300, 100
-                            self.current_character.speech_bubble = pygame.Surface((bubble_width, bubble_height),
-                                                                                  pygame.SRCALPHA)
-
-                            lime = (0, 255, 0)
-                            white = (255, 255, 255)
-                            draw_rounded_rect(self.current_character.speech_bubble, white,
-                                              self.current_character.speech_bubble.get_rect(), 10, border_color=lime,
-                                              border_width=5)
-
-                            font = pygame.font.Font(None, 36)
-                            max_text_width = bubble_width - 20
-
-                            lines = wrap_text(dialogue, font, max_text_width)
-
-                            y_offset = 10
-                            for line in lines:
-                                text = font.render(line, True, (0, 0, 0))
-                                self.current_character.speech_bubble.blit(text, (10, y_offset))
-                                y_offset += font.get_height()
-                    elif key == pygame.K_RETURN:
-                        if self.current_character.speech_bubble:
-                            self.current_character.next_dialog()
-                            dialogue = self.current_character.interact()
-
-                            bubble_width, bubble_height = 300, 100
-                            self.current_character.speech_bubble = pygame.Surface((bubble_width, bubble_height),
-                                                                                  pygame.SRCALPHA)
-
-                            lime = (0, 255, 0)
-                            white = (255, 255, 255)
-                            draw_rounded_rect(self.current_character.speech_bubble, white,
-                                              self.current_character.speech_bubble.get_rect(), 10, border_color=lime,
-                                              border_width=5)
-
-                            font = pygame.font.Font(None, 36)
-                            max_text_width = bubble_width - 20
-
-                            lines = wrap_text(dialogue, font, max_text_width)
-
-                            y_offset = 10
-                            for line in lines:
-                                text = font.render(line, True, (0, 0, 0))
-                                self.current_character.speech_bubble.blit(text, (10, y_offset))
-                                y_offset += font.get_height()
-                    elif key == pygame.K_f:
-                        for character in [self.alex, self.spencer, self.stephen]:
-                            print_character_location(character)
-                    elif key == pygame.K_r:
-                        if self.current_character.speech_bubble:
-                            self.current_character.speech_bubble = None
-                            self.current_character.speech_bubble_start_time = None
-                    elif key == pygame.K_ESCAPE:
-                        self.restart_game()
-
-            if self.current_character and not self.current_character.stop_moving:
-                self.current_character.input()
-
-            self.all_sprites.update(dt)
-            if self.camera_target:
-                self.all_sprites.set_camera(self.camera_target.rect, self.world_rect)
-
-            self.display_surface.fill((0, 0, 0))
-            self.display_surface.blit(self.test_surface, self.all_sprites.offset)
-            self.all_sprites.draw(self.display_surface)
-
-            if self.current_character.speech_bubble:
-                bubble_x = self.current_character.rect.centerx - self.current_character.speech_bubble.get_width() // 2
-                bubble_y = self.current_character.rect.top - self.current_character.speech_bubble.get_height() - 10
-                bubble_position = (bubble_x + self.all_sprites.offset.x, bubble_y + self.all_sprites.offset.y)
-
-                self.display_surface.blit(self.current_character.speech_bubble, bubble_position)
-
-            pygame.display.flip()  # Use flip instead of update()
+            dt = self.clock.tick(self.render_fps) / 1000
+            if not self.frame(dt, pygame.event.get()):
+                if self.presence:
+                    self.presence.close()
+                pygame.quit()
+                return  # Exit the loop instead of using exit()
 
             await asyncio.sleep(0)  # Yield control to event loop
 
@@ -304,35 +573,6 @@ def print_character_location(character):
     y_tile = pixel_to_tile(y_pixel, TILE_SIZE)
     print(f"Character's Location: TILE_SIZE * {x_tile}, TILE_SIZE * {y_tile}")
 
-def wrap_text(text, font, max_width):
-    words = text.split(' ')
-    lines = []
-    current_line = ""
-
-    for word in words:
-        test_line = current_line + word + " "
-        if font.size(test_line)[0] <= max_width:
-            current_line = test_line
-        else:
-            lines.append(current_line.strip())
-            current_line = word + " "
-
-    if current_line:
-        lines.append(current_line.strip())
-
-    return lines
-
-def draw_rounded_rect(surface, color, rect, radius, border_color=None, border_width=0):
-    rect = pygame.Rect(rect)
-    shape_surf = pygame.Surface(rect.size, pygame.SRCALPHA)
-
-    pygame.draw.rect(shape_surf, color, shape_surf.get_rect(), border_radius=radius)
-
-    if border_color and border_width > 0:
-        pygame.draw.rect(shape_surf, border_color, shape_surf.get_rect(), border_radius=radius, width=border_width)
-
-    surface.blit(shape_surf, rect.topleft)
-
 if __name__ == '__main__':
-    game = Game()
+    game = Game(deferred=True)
     asyncio.run(game.run())  # Run the async game loop
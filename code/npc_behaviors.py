@@ -1,55 +1,186 @@
+import math
 import pygame
 import random
+from settings import STUCK_TIME
 
 
 class Behavior:
+    __slots__ = ()
+
     def update(self, entity, dt):
         pass
 
+    def advance(self, entity, elapsed):
+        # Catch up on time spent asleep far from the camera; behaviors without a cheap closed form just resume
+        pass
+
+    def snapshot(self):
+        return None
+
+    def restore(self, state):
+        pass
+
 
 class PathBehavior(Behavior):
+    __slots__ = ('path', 'current_index', 'speed', 'target_position', 'detour', 'routing', 'stuck_time')
+
     def __init__(self, path, speed=100):
         self.path = path
         self.current_index = 0
         self.speed = speed
         self.target_position = self.path[self.current_index]
+        self.detour = []  # Pathfinder waypoints around whatever blocked the way to target_position
+        self.routing = False
+        self.stuck_time = 0.0
+
+    def next_waypoint(self):
+        self.current_index = (self.current_index + 1) % len(self.path)
+        self.target_position = self.path[self.current_index]
+        self.detour = []
+        self.routing = False
 
     def update(self, character, dt):
         if not self.path:
             return
 
-        # Move towards the target position
-        x_diff = self.target_position[0] - character.rect.centerx
-        y_diff = self.target_position[1] - character.rect.centery
-        distance = max(abs(x_diff), abs(y_diff))
+        # Whatever is left of the step after reaching a waypoint goes towards the next one, so a long step
+        # (a sprite updated every few ticks) ends where the same time in short steps would
+        budget = self.speed * dt
+        left, top = character.rect.left, character.rect.top
+        for _ in range(len(self.path) + len(self.detour) + 1):
+            target = self.detour[0] if self.detour else self.target_position
+            x_diff = target[0] - character.rect.centerx
+            y_diff = target[1] - character.rect.centery
+            distance = max(abs(x_diff), abs(y_diff))
+
+            if distance < 1:  # Close enough to the target
+                if self.detour:
+                    self.detour.pop(0)
+                else:
+                    # Move to the next waypoint
+                    self.next_waypoint()
+                continue
+            # Move towards the target position, stopping on it rather than overshooting
+            step = min(budget, distance)
+            dx, dy = x_diff / distance * step, y_diff / distance * step
+            blocked_x, blocked_y = character.move_by(dx, dy)
+            if blocked_x or blocked_y:
+                # Against a collider: slide the whole step along the free axis, and stop only when both are blocked
+                if blocked_x and not blocked_y and y_diff:
+                    character.move_by(0, math.copysign(min(step, abs(y_diff)), y_diff) - dy)
+                elif blocked_y and not blocked_x and x_diff:
+                    character.move_by(math.copysign(min(step, abs(x_diff)), x_diff) - dx, 0)
+                break
+            budget -= step
+            if budget <= 0:
+                break
 
-        if distance < 1:  # Close enough to the target
-            # Move to the next waypoint
-            self.current_index = (self.current_index + 1) % len(self.path)
-            self.target_position = self.path[self.current_index]
+        # Blocked on both axes, or sliding into a corner: the same STUCK_TIME as Character's target movement
+        if character.rect.left == left and character.rect.top == top:
+            self.stuck_time += dt
+            if self.stuck_time >= STUCK_TIME:
+                self.stuck_time = 0.0
+                self.reroute(character)
         else:
-            # Move towards the target position
-            x_velocity = (x_diff / distance) * self.speed * dt
-            y_velocity = (y_diff / distance) * self.speed * dt
-            character.rect.x += x_velocity
-            character.rect.y += y_velocity
+            self.stuck_time = 0.0
+
+    def reroute(self, character):
+        # Route around the obstacle; if there is no route, or the detour is blocked too, skip the waypoint
+        if self.routing:
+            return
+        if self.detour or character.pathfinder is None:
+            self.next_waypoint()
+            return
+        self.routing = True
+        target = self.target_position
+
+        def on_path(waypoints):
+            if not self.routing or self.target_position != target:
+                return
+            self.routing = False
+            if waypoints:
+                self.detour = waypoints
+            else:
+                self.next_waypoint()
+
+        character.plan_route(target, on_path)
+
+    def snapshot(self):
+        return self.current_index
+
+    def restore(self, state):
+        self.current_index = state
+        self.target_position = self.path[self.current_index]
+        self.detour = []
+        self.routing = False
+        self.stuck_time = 0.0
+
+    def advance(self, character, elapsed):
+        # Walk the path in one go, ignoring collisions, at the speed update moves along the longer axis
+        if not self.path:
+            return
+        self.detour = []
+        self.routing = False
+        self.stuck_time = 0.0
+        budget = self.speed * elapsed
+        x, y = character.rect.center
+        lap = None
+        while budget > 0:
+            target_x, target_y = self.target_position
+            distance = max(abs(target_x - x), abs(target_y - y))
+            if distance > budget:
+                x += (target_x - x) * budget / distance
+                y += (target_y - y) * budget / distance
+                break
+            budget -= distance
+            x, y = target_x, target_y
+            self.next_waypoint()
+            if lap is None:
+                # Now on a waypoint, whole laps of the loop change nothing
+                lap = sum(max(abs(b[0] - a[0]), abs(b[1] - a[1]))
+                          for a, b in zip(self.path, self.path[1:] + self.path[:1]))
+                if not lap:
+                    break
+                budget %= lap
+        character.rect.center = (round(x), round(y))
 
 class WanderBehavior(Behavior):
+    __slots__ = ('direction_change_interval', 'wander_area', 'speed', 'time_since_change', 'current_direction')
+
     def __init__(self, direction_change_interval=3.0, wander_area=None, speed=100):
         self.direction_change_interval = direction_change_interval
         self.wander_area = wander_area
         self.speed = speed
         self.time_since_change = 0
-        self.current_direction = pygame.Vector2(random.choice([1, -1]), random.choice([1, -1])).normalize()
+        self.current_direction = pygame.Vector2()
+        self.pick_direction()
+
+    def pick_direction(self):
+        self.current_direction.update(random.choice((1, -1)), random.choice((1, -1)))
+        self.current_direction.normalize_ip()
+
+    def advance(self, character, elapsed):
+        self.time_since_change = (self.time_since_change + elapsed) % self.direction_change_interval
+
+    def snapshot(self):
+        return self.time_since_change, (self.current_direction.x, self.current_direction.y)
+
+    def restore(self, state):
+        self.time_since_change, direction = state
+        self.current_direction.update(direction)
 
     def update(self, character, dt):
         self.time_since_change += dt
         if self.time_since_change >= self.direction_change_interval:
             self.time_since_change = 0
-            self.current_direction = pygame.Vector2(random.choice([1, -1]), random.choice([1, -1])).normalize()
+            self.pick_direction()
 
-        character.rect.x += self.current_direction.x * self.speed * dt
-        character.rect.y += self.current_direction.y * self.speed * dt
+        blocked_x, blocked_y = character.move_by(self.current_direction.x * self.speed * dt,
+                                                 self.current_direction.y * self.speed * dt)
+        if blocked_x:
+            self.current_direction.x *= -1
+        if blocked_y:
+            self.current_direction.y *= -1
 
         if self.wander_area:
             if character.rect.left < self.wander_area.left:
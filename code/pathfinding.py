@@ -0,0 +1,288 @@
+import heapq
+import math
+import os
+from collections import Counter, OrderedDict, deque
+
+import pygame
+from settings import TILE_SIZE
+
+SQRT2 = 2 ** 0.5
+NEIGHBOURS = (
+    (1, 0, 1.0), (-1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0),
+    (1, 1, SQRT2), (1, -1, SQRT2), (-1, 1, SQRT2), (-1, -1, SQRT2),
+)
+
+
+class WalkabilityGrid:
+    def __init__(self, cols, rows, blocked, tile_size=TILE_SIZE):
+        self.cols = cols
+        self.rows = rows
+        self.blocked = blocked  # bytearray, one byte per tile, row-major; non-zero means solid
+        self.tile_size = tile_size
+
+    @classmethod
+    def from_surface(cls, surface, tile_size=TILE_SIZE, tolerance=40, samples=4, min_floor_samples=10):
+        # Without a collision layer, guess from the art: the carpet is the most common tile colour,
+        # and a tile is walkable when most of a samples x samples grid of its pixels look like carpet
+        width, height = surface.get_size()
+        cols, rows = width // tile_size, height // tile_size
+        pixels = pygame.image.tobytes(surface, 'RGB')
+
+        def pixel(x, y):
+            i = (y * width + x) * 3
+            return pixels[i], pixels[i + 1], pixels[i + 2]
+
+        half = tile_size // 2
+        floor = Counter(pixel(col * tile_size + half, row * tile_size + half)
+                        for row in range(rows) for col in range(cols)).most_common(1)[0][0]
+
+        step = tile_size // samples
+        offsets = [(step // 2 + sx * step, step // 2 + sy * step) for sy in range(samples) for sx in range(samples)]
+        blocked = bytearray(cols * rows)
+        for row in range(rows):
+            for col in range(cols):
+                left, top = col * tile_size, row * tile_size
+                floor_samples = 0
+                for dx, dy in offsets:
+                    r, g, b = pixel(left + dx, top + dy)
+                    if abs(r - floor[0]) + abs(g - floor[1]) + abs(b - floor[2]) <= tolerance:
+                        floor_samples += 1
+                blocked[row * cols + col] = floor_samples < min_floor_samples
+        return cls(cols, rows, blocked, tile_size)
+
+    @classmethod
+    def from_mask(cls, mask_surface, tile_size=TILE_SIZE):
+        # Collision layer: any visible pixel in a tile makes it solid
+        width, height = mask_surface.get_size()
+        cols, rows = width // tile_size, height // tile_size
+        blocked = bytearray(cols * rows)
+        mask = pygame.mask.from_surface(mask_surface)
+        tile = pygame.mask.Mask((tile_size, tile_size), fill=True)
+        for row in range(rows):
+            for col in range(cols):
+                blocked[row * cols + col] = mask.overlap_area(tile, (col * tile_size, row * tile_size)) > 0
+        return cls(cols, rows, blocked, tile_size)
+
+    def walkable(self, col, row):
+        return 0 <= col < self.cols and 0 <= row < self.rows and not self.blocked[row * self.cols + col]
+
+    def area_walkable(self, x, y, width, height):
+        # Whether a width x height box centred on (x, y) lies on walkable tiles only
+        tile_size = self.tile_size
+        left, right = math.floor(x - width / 2), math.ceil(x + width / 2)
+        top, bottom = math.floor(y - height / 2), math.ceil(y + height / 2)
+        for row in range(top // tile_size, (bottom - 1) // tile_size + 1):
+            for col in range(left // tile_size, (right - 1) // tile_size + 1):
+                if not self.walkable(col, row):
+                    return False
+        return True
+
+    def eroded(self, width, height):
+        # The solid tiles grown by half a width x height box: a tile stays walkable only when the box fits
+        # centred on it, so a body that size can stand on every tile a search of the copy walks through
+        blocked = bytearray(self.cols * self.rows)
+        for row in range(self.rows):
+            for col in range(self.cols):
+                x, y = self.tile_center((col, row))
+                blocked[row * self.cols + col] = not self.area_walkable(x, y, width, height)
+        return WalkabilityGrid(self.cols, self.rows, blocked, self.tile_size)
+
+    def tile_at(self, position):
+        return int(position[0]) // self.tile_size, int(position[1]) // self.tile_size
+
+    def tile_center(self, tile):
+        return tile[0] * self.tile_size + self.tile_size // 2, tile[1] * self.tile_size + self.tile_size // 2
+
+    def nearest_walkable(self, tile, max_radius=8):
+        if self.walkable(*tile):
+            return tile
+        col, row = tile
+        for radius in range(1, max_radius + 1):
+            ring = [(col + dx, row + dy) for dx in range(-radius, radius + 1) for dy in (-radius, radius)]
+            ring += [(col + dx, row + dy) for dx in (-radius, radius) for dy in range(-radius + 1, radius)]
+            ring.sort(key=lambda candidate: (candidate[0] - col) ** 2 + (candidate[1] - row) ** 2)
+            for candidate in ring:
+                if self.walkable(*candidate):
+                    return candidate
+        return None
+
+    def line_walkable(self, start, end, footprint=None):
+        # Sample the segment every quarter tile; good enough to let string pulling skip waypoints safely.
+        # With a (width, height) footprint, the box swept from each sample to the next has to be clear.
+        (x0, y0), (x1, y1) = self.tile_center(start), self.tile_center(end)
+        steps = max(abs(x1 - x0), abs(y1 - y0)) * 4 // self.tile_size + 1
+        if footprint is not None:
+            step_x, step_y = (x1 - x0) / steps, (y1 - y0) / steps
+            width, height = footprint[0] + abs(step_x), footprint[1] + abs(step_y)
+            for i in range(steps):
+                t = (i + 0.5) / steps
+                if not self.area_walkable(x0 + (x1 - x0) * t, y0 + (y1 - y0) * t, width, height):
+                    return False
+            return True
+        for i in range(steps + 1):
+            t = i / steps
+            if not self.walkable(*self.tile_at((x0 + (x1 - x0) * t, y0 + (y1 - y0) * t))):
+                return False
+        return True
+
+
+def load_walkability(base_dir, world_image=None, tile_size=TILE_SIZE, grid=None):
+    # grid is a precomputed guess (from the region cache) used in place of scanning world_image
+    collision_path = os.path.join(base_dir, 'assets', 'graphics', 'map', 'collision.png')
+    if os.path.exists(collision_path):
+        return WalkabilityGrid.from_mask(pygame.image.load(collision_path).convert_alpha(), tile_size)
+    if grid is not None:
+        return grid
+    return WalkabilityGrid.from_surface(world_image, tile_size)
+
+
+class PathSearch:
+    # A* over the tile grid, 8-connected without cutting corners, that can be run a slice at a time
+    def __init__(self, grid, start, goal, footprint=None):
+        self.grid = grid
+        self.footprint = footprint
+        self.start = start
+        self.goal = goal
+        self.came_from = {start: None}
+        self.cost = {start: 0.0}
+        self.open = [(self.heuristic(start), 0.0, start)]
+        self.closed = set()
+        self.done = False
+        self.path = None
+
+    def heuristic(self, tile):
+        dx = abs(tile[0] - self.goal[0])
+        dy = abs(tile[1] - self.goal[1])
+        return max(dx, dy) + (SQRT2 - 1) * min(dx, dy)
+
+    def step(self, budget):
+        grid = self.grid
+        expanded = 0
+        while self.open and expanded < budget:
+            _, cost, tile = heapq.heappop(self.open)
+            if tile in self.closed:
+                continue
+            if tile == self.goal:
+                self.finish(tile)
+                return expanded
+            self.closed.add(tile)
+            expanded += 1
+
+            col, row = tile
+            for dx, dy, step_cost in NEIGHBOURS:
+                neighbour = (col + dx, row + dy)
+                if neighbour in self.closed or not grid.walkable(*neighbour):
+                    continue
+                if dx and dy and not (grid.walkable(col + dx, row) and grid.walkable(col, row + dy)):
+                    continue
+                new_cost = cost + step_cost
+                if new_cost < self.cost.get(neighbour, float('inf')):
+                    self.cost[neighbour] = new_cost
+                    self.came_from[neighbour] = tile
+                    heapq.heappush(self.open, (new_cost + self.heuristic(neighbour), new_cost, neighbour))
+
+        if not self.open:
+            self.done = True
+        return expanded
+
+    def finish(self, tile):
+        path = []
+        while tile is not None:
+            path.append(tile)
+            tile = self.came_from[tile]
+        path.reverse()
+        self.path = self.smooth(path)
+        self.done = True
+
+    def smooth(self, path):
+        if len(path) < 3:
+            return path
+        smoothed = [path[0]]
+        anchor = 0
+        for i in range(2, len(path)):
+            if not self.grid.line_walkable(path[anchor], path[i], self.footprint):
+                anchor = i - 1
+                smoothed.append(path[anchor])
+        smoothed.append(path[-1])
+        return smoothed
+
+
+class Pathfinder:
+    def __init__(self, grid, cache_size=256, budget=1500, footprint=None):
+        # footprint is the (width, height) of what collides, e.g. the feet hitbox. Routes are planned on the
+        # grid eroded by it and only straightened where it fits the whole way, so a collision-checked body
+        # can follow them; start and goal positions are where that box is centred.
+        self.grid = grid
+        self.footprint = footprint
+        self.route_grid = grid.eroded(*footprint) if footprint is not None else grid
+        self.cache_size = cache_size
+        self.budget = budget  # Node expansions per pump, shared by all running searches
+        self.cache = OrderedDict()
+        self.searches = deque()
+        self.waiting = {}
+
+    @property
+    def pending(self):
+        return bool(self.searches)
+
+    def to_waypoints(self, tiles, goal):
+        waypoints = [self.route_grid.tile_center(tile) for tile in tiles[1:]]
+        if waypoints:
+            waypoints[-1] = tuple(goal)
+        else:
+            waypoints.append(tuple(goal))
+        return waypoints
+
+    def resolve(self, start, goal):
+        grid = self.route_grid
+        start_tile = grid.nearest_walkable(grid.tile_at(start))
+        goal_tile = grid.nearest_walkable(grid.tile_at(goal))
+        return start_tile, goal_tile
+
+    def request(self, start, goal, callback):
+        # callback receives pixel waypoints (ending exactly at goal), or None when there is no route
+        start_tile, goal_tile = self.resolve(start, goal)
+        if start_tile is None or goal_tile is None:
+            callback(None)
+            return
+
+        key = (start_tile, goal_tile)
+        tiles = self.cache.get(key)
+        if tiles is not None:
+            self.cache.move_to_end(key)
+            callback(self.to_waypoints(tiles, goal))
+            return
+
+        waiting = self.waiting.get(key)
+        if waiting is not None:
+            waiting.append((goal, callback))
+            return
+        self.waiting[key] = [(goal, callback)]
+        self.searches.append((key, PathSearch(self.route_grid, start_tile, goal_tile, self.footprint)))
+
+    def cancel(self):
+        # Drops the searches in flight without calling back; finished paths stay cached
+        self.searches.clear()
+        self.waiting.clear()
+
+    def pump(self):
+        budget = self.budget
+        while self.searches and budget > 0:
+            key, search = self.searches[0]
+            budget -= search.step(budget)
+            if not search.done:
+                break
+            self.searches.popleft()
+            if search.path is not None:
+                self.cache[key] = tuple(search.path)
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+            for goal, callback in self.waiting.pop(key, ()):
+                callback(self.to_waypoints(search.path, goal) if search.path is not None else None)
+
+    def find_path(self, start, goal):
+        result = []
+        self.request(start, goal, result.append)
+        while not result:
+            self.pump()
+        return result[0]
@@ -0,0 +1,408 @@
+import argparse
+import asyncio
+import itertools
+import struct
+import time
+from collections import deque
+
+import pygame
+from settings import PRESENCE_TICK_RATE, PRESENCE_VIEW_MARGIN, PRESENCE_INTERPOLATION_DELAY
+from spatial import SpatialGrid
+from entities import STATE_NAMES, frame_table
+
+# Every message is a kind byte and a payload length, then the payload
+MESSAGE_HEADER = struct.Struct('<BI')
+HELLO, WELCOME, STATE, UPDATE = range(1, 5)
+MAX_PAYLOAD = 1 << 20
+
+# Positions are whole pixels in a uint16, animation states one byte (entities.STATE_NAMES)
+PLAYER_ID = struct.Struct('<H')
+STATE_MESSAGE = struct.Struct('<HHBhhHH')  # x, y, state, then the camera rect the client wants updates for
+UPDATE_HEADER = struct.Struct('<HHH')  # entered, moved and left counts
+ENTERED = struct.Struct('<HHHBB')  # id, x, y, state, length of the sheet name that follows
+MOVED = struct.Struct('<HB')  # id, flags; then the fields the flags name
+NUDGE = struct.Struct('<bb')
+POINT = struct.Struct('<HH')
+STATE_BYTE = struct.Struct('<B')
+MOVED_NEAR, MOVED_FAR, CHANGED_STATE = 1, 2, 4
+SEND_BUFFER_LIMIT = 64 * 1024  # A client this far behind gets no updates until it catches up
+
+
+def send_message(writer, kind, payload=b''):
+    writer.write(MESSAGE_HEADER.pack(kind, len(payload)) + payload)
+
+
+async def read_message(reader):
+    kind, length = MESSAGE_HEADER.unpack(await reader.readexactly(MESSAGE_HEADER.size))
+    if length > MAX_PAYLOAD:
+        raise ConnectionError(f"Message of {length} bytes is too large")
+    return kind, await reader.readexactly(length)
+
+
+def clamp_coordinate(value):
+    return min(max(int(value), 0), 0xFFFF)
+
+
+def pack_moved(player_id, last, current):
+    x, y, state = current
+    flags = 0
+    fields = b''
+    dx, dy = x - last[0], y - last[1]
+    if dx or dy:
+        if -128 <= dx < 128 and -128 <= dy < 128:
+            flags |= MOVED_NEAR
+            fields += NUDGE.pack(dx, dy)
+        else:
+            flags |= MOVED_FAR
+            fields += POINT.pack(x, y)
+    if state != last[2]:
+        flags |= CHANGED_STATE
+        fields += STATE_BYTE.pack(state)
+    return MOVED.pack(player_id, flags) + fields
+
+
+class Presence:
+    # The server's record of one connected visitor
+    __slots__ = ('id', 'sheet', 'rect', 'state', 'view', 'known', 'writer', 'current', 'previous', 'moved', 'entered')
+
+    def __init__(self, player_id, sheet, writer):
+        self.id = player_id
+        self.sheet = sheet.encode('utf-8')[:255]
+        self.rect = pygame.Rect(0, 0, 1, 1)
+        self.state = 1
+        self.view = pygame.Rect(0, 0, 0, 0)
+        self.known = {}  # id -> the current tuple of each player as last sent to this visitor
+        self.writer = writer
+        self.current = self.previous = None  # (x, y, state) this tick and last tick, a new tuple only on change
+        self.moved = self.entered = None  # This tick's messages, the same bytes for every visitor up to date
+
+    def prepare(self):
+        x, y = self.rect.center
+        current = (x, y, self.state)
+        self.previous = self.current
+        if current != self.current:
+            self.current = current
+            self.entered = None
+            self.moved = pack_moved(self.id, self.previous, current) if self.previous else None
+        else:
+            self.moved = None
+
+
+class PresenceServer:
+    # Relays where every visitor is to the visitors whose camera can see them. Each tick a visitor gets one
+    # UPDATE with the players that came into view, the changes of the ones it already knows about and the
+    # ones that left; a player standing still costs nothing.
+    def __init__(self, tick_rate=PRESENCE_TICK_RATE, view_margin=PRESENCE_VIEW_MARGIN):
+        self.tick_rate = tick_rate
+        self.view_margin = view_margin
+        self.players = {}
+        self.grid = SpatialGrid(cell_size=256)
+        self.ids = itertools.count(1)
+        self.server = None
+        self.task = None
+        self.handlers = set()
+        self.tick_times = deque(maxlen=1000)
+        self.bytes_sent = 0
+
+    async def start(self, host='127.0.0.1', port=0):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        self.task = asyncio.create_task(self.run())
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        for player in list(self.players.values()):
+            player.writer.close()
+        # Let the connection handlers see their sockets close before the loop goes away
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+
+    def new_id(self):
+        for player_id in self.ids:
+            player_id &= 0xFFFF
+            if player_id and player_id not in self.players:
+                return player_id
+
+    async def handle(self, reader, writer):
+        task = asyncio.current_task()
+        self.handlers.add(task)
+        player = None
+        try:
+            kind, payload = await read_message(reader)
+            if kind != HELLO:
+                return
+            player = Presence(self.new_id(), payload.decode('utf-8', 'replace'), writer)
+            self.players[player.id] = player
+            send_message(writer, WELCOME, PLAYER_ID.pack(player.id))
+            while True:
+                kind, payload = await read_message(reader)
+                if kind == STATE:
+                    self.move(player, *STATE_MESSAGE.unpack(payload))
+        except (asyncio.IncompleteReadError, ConnectionError, struct.error):
+            pass
+        finally:
+            if player is not None:
+                del self.players[player.id]
+                self.grid.remove(player)
+            writer.close()
+            self.handlers.discard(task)
+
+    def move(self, player, x, y, state, view_x, view_y, view_width, view_height):
+        player.rect.center = (x, y)
+        player.state = state
+        player.view.update(view_x, view_y, view_width, view_height)
+        self.grid.update(player)
+
+    async def run(self):
+        interval = 1 / self.tick_rate
+        while True:
+            await asyncio.sleep(interval)
+            start = time.perf_counter()
+            self.broadcast()
+            self.tick_times.append(time.perf_counter() - start)
+
+    def broadcast(self):
+        for player in self.players.values():
+            player.prepare()
+        for player in self.players.values():
+            if player.writer.transport.get_write_buffer_size() > SEND_BUFFER_LIMIT:
+                continue
+            payload = self.update_for(player)
+            if payload is not None:
+                send_message(player.writer, UPDATE, payload)
+                self.bytes_sent += MESSAGE_HEADER.size + len(payload)
+
+    def update_for(self, player):
+        # Deltas against what this visitor was last sent; TCP keeps them in order, so nothing needs resending
+        known = player.known
+        view = player.view.inflate(self.view_margin * 2, self.view_margin * 2)
+        entered, moved = [], []
+        seen = set()
+        for other in self.grid.query_rect(view):
+            if other is player or other.current is None:
+                continue
+            other_id = other.id
+            seen.add(other_id)
+            current = other.current
+            last = known.get(other_id)
+            if last is current:
+                continue
+            if last is None:
+                if other.entered is None:
+                    other.entered = ENTERED.pack(other_id, *current, len(other.sheet)) + other.sheet
+                entered.append(other.entered)
+            elif last is other.previous and other.moved is not None:
+                moved.append(other.moved)
+            else:
+                # Fell behind, e.g. skipped while its send buffer was full
+                moved.append(pack_moved(other_id, last, current))
+            known[other_id] = current
+
+        left = [player_id for player_id in known if player_id not in seen]
+        for player_id in left:
+            del known[player_id]
+        if not (entered or moved or left):
+            return None
+        return b''.join([UPDATE_HEADER.pack(len(entered), len(moved), len(left))] + entered + moved +
+                        [PLAYER_ID.pack(player_id) for player_id in left])
+
+
+class PresenceConnection:
+    # The client end of the protocol. Keeps everyone the server reports in self.players as
+    # id -> [x, y, state, sheet]; subclasses react through entered, moved and left.
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.id = None
+        self.players = {}
+        self.listener = None
+        self.last_sent = None
+        self.bytes_received = 0
+
+    async def connect(self, host, port, sheet):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        send_message(self.writer, HELLO, sheet.encode('utf-8'))
+        kind, payload = await read_message(self.reader)
+        if kind != WELCOME:
+            raise ConnectionError("The presence server did not welcome us")
+        self.id, = PLAYER_ID.unpack(payload)
+        self.listener = asyncio.create_task(self.listen())
+        return self.id
+
+    def close(self):
+        if self.listener:
+            self.listener.cancel()
+        if self.writer:
+            self.writer.close()
+
+    @property
+    def connected(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    def send_state(self, x, y, state, view):
+        # Only sent when something changed
+        message = STATE_MESSAGE.pack(clamp_coordinate(x), clamp_coordinate(y), state,
+                                     view.x, view.y, view.width, view.height)
+        if message == self.last_sent or not self.connected:
+            return False
+        send_message(self.writer, STATE, message)
+        self.last_sent = message
+        return True
+
+    async def listen(self):
+        try:
+            while True:
+                kind, payload = await read_message(self.reader)
+                self.bytes_received += MESSAGE_HEADER.size + len(payload)
+                if kind == UPDATE:
+                    self.apply_update(payload)
+        except (asyncio.IncompleteReadError, ConnectionError, struct.error):
+            pass
+        finally:
+            self.writer.close()
+            for player_id in list(self.players):
+                del self.players[player_id]
+                self.left(player_id)
+
+    def apply_update(self, payload):
+        entered, moved, left = UPDATE_HEADER.unpack_from(payload)
+        position = UPDATE_HEADER.size
+        players = self.players
+        for _ in range(entered):
+            player_id, x, y, state, length = ENTERED.unpack_from(payload, position)
+            position += ENTERED.size
+            sheet = payload[position:position + length].decode('utf-8', 'replace')
+            position += length
+            players[player_id] = [x, y, state, sheet]
+            self.entered(player_id, sheet, x, y, state)
+        for _ in range(moved):
+            player_id, flags = MOVED.unpack_from(payload, position)
+            position += MOVED.size
+            player = players[player_id]
+            if flags & MOVED_NEAR:
+                dx, dy = NUDGE.unpack_from(payload, position)
+                position += NUDGE.size
+                player[0] += dx
+                player[1] += dy
+            elif flags & MOVED_FAR:
+                player[0], player[1] = POINT.unpack_from(payload, position)
+                position += POINT.size
+            if flags & CHANGED_STATE:
+                player[2], = STATE_BYTE.unpack_from(payload, position)
+                position += STATE_BYTE.size
+            self.moved(player_id, player[0], player[1], player[2])
+        for _ in range(left):
+            player_id, = PLAYER_ID.unpack_from(payload, position)
+            position += PLAYER_ID.size
+            if players.pop(player_id, None) is not None:
+                self.left(player_id)
+
+    def entered(self, player_id, sheet, x, y, state):
+        pass
+
+    def moved(self, player_id, x, y, state):
+        pass
+
+    def left(self, player_id):
+        pass
+
+
+class RemotePlayer(pygame.sprite.Sprite):
+    # Another visitor, drawn PRESENCE_INTERPOLATION_DELAY behind its latest update so it glides between them
+    def __init__(self, pos, state, frames, groups, animation_speed=6):
+        super().__init__(groups)
+        self.frames = frames
+        self.frame_table = frame_table(frames)
+        self.animation_speed = animation_speed
+        self.frame_index = 0.0
+        self.clock = 0.0
+        self.samples = deque([(0.0, pos[0], pos[1], state)], maxlen=8)
+        self.image = self.frame_table[state][0]
+        self.rect = self.image.get_rect(center=pos)
+        self.previous_topleft = self.rect.topleft
+
+    def push(self, x, y, state):
+        self.samples.append((self.clock, x, y, state))
+
+    def advance(self, elapsed):
+        self.clock += elapsed
+
+    def update(self, dt):
+        self.clock += dt
+        render_time = self.clock - PRESENCE_INTERPOLATION_DELAY
+        samples = self.samples
+        while len(samples) > 1 and samples[1][0] <= render_time:
+            samples.popleft()
+        _, x, y, state = samples[0]
+        if len(samples) > 1 and render_time > samples[0][0]:
+            start = samples[0][0]
+            end, next_x, next_y, state = samples[1]
+            amount = (render_time - start) / (end - start)
+            x += (next_x - x) * amount
+            y += (next_y - y) * amount
+        self.rect.center = (round(x), round(y))
+
+        frames = self.frame_table[state]
+        self.frame_index += self.animation_speed * dt
+        self.image = frames[int(self.frame_index % len(frames))]
+
+
+class PresenceClient(PresenceConnection):
+    # Puts the other visitors into a Game as RemotePlayers and reports the played character, at most tick_rate
+    # times a second and only when it moved, turned or the camera did
+    def __init__(self, game, tick_rate=PRESENCE_TICK_RATE, fallback_sheet='player'):
+        super().__init__()
+        self.game = game
+        self.interval = 1 / tick_rate
+        self.fallback_sheet = fallback_sheet
+        self.since_sent = 0.0
+        self.sprites = {}
+        self.departed = False  # Someone left since the last sync, so their sheet may be unused now
+
+    def entered(self, player_id, sheet, x, y, state):
+        characters = self.game.overworld_frames['characters']
+        frames = characters[sheet] if sheet in characters else characters[self.fallback_sheet]
+        if state >= len(STATE_NAMES):
+            state = 1
+        self.sprites[player_id] = RemotePlayer((x, y), state, frames, self.game.all_sprites)
+
+    def moved(self, player_id, x, y, state):
+        if state < len(STATE_NAMES):
+            self.sprites[player_id].push(x, y, state)
+
+    def left(self, player_id):
+        sprite = self.sprites.pop(player_id, None)
+        if sprite is not None:
+            sprite.kill()
+            self.departed = True
+
+    def sync(self, dt):
+        if self.departed:
+            self.departed = False
+            self.game.evict_sheets()
+        self.since_sent += dt
+        if self.since_sent < self.interval:
+            return
+        self.since_sent = 0.0
+        character = self.game.current_character
+        if character is not None:
+            x, y = character.rect.center
+            self.send_state(x, y, character.get_state_code(), self.game.all_sprites.camera_rect)
+
+
+async def serve(host, port):
+    server = PresenceServer()
+    port = await server.start(host, port)
+    print(f"Presence server listening on {host}:{port}")
+    await server.task
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Presence server for a shared InternHub.")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=7777)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+import math
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+from settings import WINDOW_WIDTH, WINDOW_HEIGHT, PRESENCE_TICK_RATE
+from entities import DOWN, LEFT, RIGHT, UP
+from presence import PresenceServer, PresenceConnection
+from benchmark import summarize
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHEETS = ('blond', 'hat_girl', 'purple_girl', 'straw', 'npc1')
+
+
+class Bot(PresenceConnection):
+    # A simulated visitor walking between random points, with a window-sized camera on itself
+    def __init__(self, world_rect, rng, speed=125):
+        super().__init__()
+        self.world_rect = world_rect
+        self.rng = rng
+        self.speed = speed
+        self.x, self.y = self.random_point()
+        self.target = self.random_point()
+        self.facing = DOWN
+        self.view = pygame.Rect(0, 0, WINDOW_WIDTH, WINDOW_HEIGHT)
+
+    def random_point(self):
+        area = self.world_rect
+        return self.rng.uniform(area.left, area.right), self.rng.uniform(area.top, area.bottom)
+
+    def step(self, dt):
+        dx, dy = self.target[0] - self.x, self.target[1] - self.y
+        distance = math.hypot(dx, dy)
+        if distance < 5:
+            self.target = self.random_point()
+            moving = False
+        else:
+            travel = min(self.speed * dt, distance)
+            self.x += dx / distance * travel
+            self.y += dy / distance * travel
+            if abs(dx) > abs(dy):
+                self.facing = RIGHT if dx > 0 else LEFT
+            else:
+                self.facing = DOWN if dy > 0 else UP
+            moving = True
+        self.view.center = (round(self.x), round(self.y))
+        self.view.clamp_ip(self.world_rect)
+        self.send_state(round(self.x), round(self.y), self.facing * 2 + (0 if moving else 1), self.view)
+
+
+async def load_test(bot_count, seconds, seed=0, game=None):
+    # Everything on one loopback server in this process; with game, a headless Game joins as one more visitor
+    rng = random.Random(seed)
+    if game is not None:
+        world_rect = game.world_rect
+    else:
+        world_rect = pygame.image.load(os.path.join(base_dir, 'assets', 'graphics', 'map', 'world.png')).get_rect()
+    server = PresenceServer()
+    port = await server.start('127.0.0.1', 0)
+    bots = [Bot(world_rect, random.Random(rng.random())) for _ in range(bot_count)]
+    await asyncio.gather(*(bot.connect('127.0.0.1', port, rng.choice(SHEETS)) for bot in bots))
+    runner = None
+    if game is not None:
+        from headless import HeadlessRunner
+        await game.join(f'127.0.0.1:{port}')
+        runner = HeadlessRunner(game)
+
+    interval = 1 / PRESENCE_TICK_RATE
+    frames_per_step = max(round(interval * 60), 1)
+    steps = int(seconds * PRESENCE_TICK_RATE)
+    remote_drawn = []
+    started = time.perf_counter()
+    for _ in range(steps):
+        for bot in bots:
+            bot.step(interval)
+        if runner is not None:
+            runner.run(frames_per_step)
+            remote_drawn.append(sum(1 for sprite, _, _ in game.all_sprites.drawn
+                                    if sprite in game.presence.sprites.values()))
+        await asyncio.sleep(interval)
+    elapsed = time.perf_counter() - started
+
+    print(f"\n{bot_count} bots for {elapsed:.1f} s on a {world_rect.width}x{world_rect.height} map")
+    mean, p95 = summarize(list(server.tick_times))
+    print(f"{'server tick':<30} mean {mean * 1000:7.3f} ms   p95 {p95 * 1000:7.3f} ms")
+    print(f"{'server sends':<30} {server.bytes_sent / elapsed / 1024:7.1f} KB/s")
+    received = [bot.bytes_received / elapsed for bot in bots]
+    print(f"{'received per bot':<30} {sum(received) / len(received) / 1024:7.2f} KB/s   max "
+          f"{max(received) / 1024:.2f} KB/s")
+    print(f"{'players known per bot':<30} {sum(len(bot.players) for bot in bots) / len(bots):7.1f}")
+    if runner is not None:
+        print(f"{'remote players in game':<30} {len(game.presence.sprites):7d}   drawn on average "
+              f"{sum(remote_drawn) / max(len(remote_drawn), 1):.1f}")
+
+    for bot in bots:
+        bot.close()
+    if game is not None and game.presence:
+        game.presence.close()
+    await server.stop()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Loopback load test for the presence server.")
+    parser.add_argument('--bots', default='100,300', help="comma-separated bot counts")
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--game', action='store_true', help="also join with a headless Game and count what it draws")
+    args = parser.parse_args(argv)
+
+    pygame.init()
+    game = None
+    if args.game:
+        from main import Game
+        game = Game(headless=True)
+    for count in args.bots.split(','):
+        asyncio.run(load_test(int(count), args.seconds, game=game))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import csv
+import json
+import time
+from collections import deque
+
+import pygame
+from dialogue import get_font
+
+FRAME_STAGES = ('events', 'input', 'update', 'camera', 'world', 'sprites', 'bubble', 'flip')
+
+
+class Stage:
+    # Reused every frame, so timing a stage allocates nothing
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        if self.profiler.enabled:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profiler.enabled:
+            # Stages that run several times a frame (catch-up simulation steps) add up to one sample
+            self.profiler.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Profiler:
+    def __init__(self, window=300, enabled=False):
+        self.window = window
+        self.enabled = enabled
+        self.samples = {}
+        self.stages = {}
+        self.frame_totals = {}
+
+    def stage(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = Stage(self, name)
+        return stage
+
+    def record(self, name, seconds):
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def add(self, name, seconds):
+        # Accumulates within a frame; end_frame turns the totals into one sample each
+        self.frame_totals[name] = self.frame_totals.get(name, 0) + seconds
+
+    def end_frame(self):
+        # A frame stage that was skipped (no simulation step, a dirty-rect frame with no world pass) took no time,
+        # and recording that keeps one sample per frame for every stage
+        for name in FRAME_STAGES:
+            self.frame_totals.setdefault(name, 0)
+        for name, seconds in self.frame_totals.items():
+            self.record(name, seconds)
+        self.frame_totals.clear()
+
+    def reset(self):
+        self.samples.clear()
+        self.frame_totals.clear()
+
+    def summary(self, name):
+        samples = sorted(self.samples.get(name, ()))
+        if not samples:
+            return None
+
+        def percentile(fraction):
+            return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+        return {
+            'count': len(samples),
+            'mean_ms': sum(samples) / len(samples) * 1000,
+            'p50_ms': percentile(0.50) * 1000,
+            'p95_ms': percentile(0.95) * 1000,
+            'p99_ms': percentile(0.99) * 1000,
+            'max_ms': samples[-1] * 1000,
+        }
+
+    def summaries(self):
+        return {name: self.summary(name) for name in self.samples}
+
+    def export(self, path):
+        summaries = self.summaries()
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['stage', 'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'])
+                for name, summary in summaries.items():
+                    writer.writerow([name] + [round(summary[key], 4) if key != 'count' else summary[key]
+                                              for key in ('count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')])
+        else:
+            with open(path, 'w') as f:
+                json.dump(summaries, f, indent=2)
+        return path
+
+
+class ProfilerOverlay:
+    def __init__(self, profiler, refresh_frames=15):
+        self.profiler = profiler
+        self.visible = False
+        self.refresh_frames = refresh_frames
+        self.frames_until_refresh = 0
+        self.surface = None
+        self.font = get_font(None, 20)
+
+    def toggle(self):
+        self.visible = not self.visible
+        # Only pay for timing while someone is looking at it
+        self.profiler.enabled = self.visible
+        self.profiler.reset()
+        self.frames_until_refresh = 0
+
+    def render(self):
+        rows = [('stage (ms)', 'p50', 'p95', 'p99')]
+        names = [name for name in FRAME_STAGES if name in self.profiler.samples]
+        names += sorted(name for name in self.profiler.samples if name not in FRAME_STAGES)
+        for name in names:
+            summary = self.profiler.summary(name)
+            rows.append((name, f"{summary['p50_ms']:.2f}", f"{summary['p95_ms']:.2f}", f"{summary['p99_ms']:.2f}"))
+
+        # The default font is proportional, so each column is placed at its own x
+        column_x = (10, 260, 320, 380)
+        line_height = self.font.get_linesize()
+        surface = pygame.Surface((440, line_height * len(rows) + 20), pygame.SRCALPHA)
+        surface.fill((0, 0, 0, 180))
+        for i, row in enumerate(rows):
+            for x, text in zip(column_x, row):
+                surface.blit(self.font.render(text, True, (255, 255, 255)), (x, 10 + i * line_height))
+        return surface
+
+    def draw(self, surface):
+        if not self.visible:
+            return
+        if self.frames_until_refresh <= 0 or self.surface is None:
+            self.surface = self.render()
+            self.frames_until_refresh = self.refresh_frames
+        self.frames_until_refresh -= 1
+        surface.blit(self.surface, (10, 10))
@@ -0,0 +1,211 @@
+import marshal
+import os
+import queue
+import struct
+import sys
+import threading
+import zlib
+from collections import OrderedDict, deque
+
+import pygame
+from settings import TILE_SIZE
+from asset_cache import CACHE_DIR, file_hash
+from pathfinding import WalkabilityGrid
+
+REGION_SIZE = 256
+REGION_MEMORY = 16 * 1024 * 1024  # Decoded region surfaces kept in the LRU
+REGION_MAGIC = b'IHRG'
+REGION_VERSION = 1
+REGION_HEADER = struct.Struct('<4sHHH')
+INDEX_NAME = 'index.bin'
+
+
+def region_dir(source_path, region_size=REGION_SIZE):
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(CACHE_DIR, f"{name}-regions{region_size}t{TILE_SIZE}-{file_hash(source_path)[:16]}")
+
+
+def build_regions(source_path, directory, region_size=REGION_SIZE, tile_size=TILE_SIZE):
+    # Cuts the map into zlib-compressed RGB region files plus an index with the map size and the
+    # walkability guessed from the art, so later runs never decode the whole map
+    image = pygame.image.load(source_path).convert()
+    width, height = image.get_size()
+    os.makedirs(directory, exist_ok=True)
+    for row in range(-(-height // region_size)):
+        for col in range(-(-width // region_size)):
+            area = pygame.Rect(col * region_size, row * region_size, region_size, region_size).clip(image.get_rect())
+            pixels = pygame.image.tobytes(image.subsurface(area), 'RGB')
+            with open(os.path.join(directory, f"{col}_{row}.bin"), 'wb') as f:
+                f.write(REGION_HEADER.pack(REGION_MAGIC, REGION_VERSION, area.width, area.height))
+                f.write(zlib.compress(pixels, 6))
+
+    grid = WalkabilityGrid.from_surface(image, tile_size)
+    index = {
+        'size': (width, height),
+        'region_size': region_size,
+        'walkability': (grid.cols, grid.rows, grid.tile_size, bytes(grid.blocked)),
+    }
+    # Written last, so a build cut short is simply redone next time
+    temp_path = os.path.join(directory, INDEX_NAME + '.tmp')
+    with open(temp_path, 'wb') as f:
+        f.write(marshal.dumps(index))
+    os.replace(temp_path, os.path.join(directory, INDEX_NAME))
+    return index
+
+
+def read_region(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, width, height = REGION_HEADER.unpack_from(data)
+    if magic != REGION_MAGIC or version != REGION_VERSION:
+        raise ValueError(f"Unsupported region file {path}")
+    return pygame.image.frombytes(zlib.decompress(data[REGION_HEADER.size:]), (width, height), 'RGB')
+
+
+class RegionStore:
+    def __init__(self, directory, index, max_bytes=REGION_MEMORY, threaded=None):
+        self.directory = directory
+        self.size = index['size']
+        self.rect = pygame.Rect((0, 0), self.size)
+        self.region_size = index['region_size']
+        self.walkability = index['walkability']
+        self.max_bytes = max_bytes
+        self.surfaces = OrderedDict()  # LRU of loaded regions, least recently drawn first
+        self.bytes = 0
+        self.wanted = set()  # Regions around the camera, never evicted
+        self.wanted_list = []
+        self.requested = set()
+        self.ready = deque()
+        # pygbag has no threads: there the requests are decoded a few per frame by pump() instead
+        self.threaded = sys.platform != 'emscripten' if threaded is None else threaded
+        if self.threaded:
+            self.requests = queue.Queue()
+            threading.Thread(target=self.worker, daemon=True).start()
+        else:
+            self.requests = deque()
+
+    @classmethod
+    def open(cls, source_path, region_size=REGION_SIZE, **kwargs):
+        directory = region_dir(source_path, region_size)
+        try:
+            with open(os.path.join(directory, INDEX_NAME), 'rb') as f:
+                index = marshal.load(f)
+        except (OSError, EOFError, ValueError):
+            index = build_regions(source_path, directory, region_size)
+        return cls(directory, index, **kwargs)
+
+    def walkability_grid(self):
+        cols, rows, tile_size, blocked = self.walkability
+        return WalkabilityGrid(cols, rows, bytearray(blocked), tile_size)
+
+    def region_path(self, region):
+        return os.path.join(self.directory, f"{region[0]}_{region[1]}.bin")
+
+    def region_range(self, rect):
+        view = rect.clip(self.rect)
+        if not view.width or not view.height:
+            return []
+        size = self.region_size
+        return [(col, row)
+                for row in range(view.top // size, (view.bottom - 1) // size + 1)
+                for col in range(view.left // size, (view.right - 1) // size + 1)]
+
+    def region_topleft(self, region):
+        return region[0] * self.region_size, region[1] * self.region_size
+
+    def worker(self):
+        while True:
+            region = self.requests.get()
+            try:
+                self.ready.append((region, read_region(self.region_path(region))))
+            except (OSError, ValueError, zlib.error) as e:
+                self.ready.append((region, e))
+
+    def request(self, region):
+        if region in self.surfaces or region in self.requested:
+            return
+        self.requested.add(region)
+        if self.threaded:
+            self.requests.put(region)
+        else:
+            self.requests.append(region)
+
+    def pump(self, budget=2):
+        if not self.threaded:
+            for _ in range(min(budget, len(self.requests))):
+                region = self.requests.popleft()
+                try:
+                    self.ready.append((region, read_region(self.region_path(region))))
+                except (OSError, ValueError, zlib.error) as e:
+                    self.ready.append((region, e))
+
+        while self.ready:
+            region, surface = self.ready.popleft()
+            self.requested.discard(region)
+            if isinstance(surface, Exception):
+                print(f"Could not load map region {region}: {surface}")
+                continue
+            self.insert(region, surface)
+
+    def insert(self, region, surface):
+        if region in self.surfaces:
+            return self.surfaces[region]
+        # Converting touches the display format, so it stays on the main thread
+        surface = surface.convert()
+        self.surfaces[region] = surface
+        self.bytes += surface.get_width() * surface.get_height() * surface.get_bytesize()
+        self.evict()
+        return surface
+
+    def evict(self):
+        for region in list(self.surfaces):
+            if self.bytes <= self.max_bytes:
+                break
+            if region in self.wanted:
+                continue
+            surface = self.surfaces.pop(region)
+            self.bytes -= surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+    def get(self, region):
+        surface = self.surfaces.get(region)
+        if surface is not None:
+            self.surfaces.move_to_end(region)
+            return surface
+        # On screen and still missing: decode it now rather than show a hole
+        return self.insert(region, read_region(self.region_path(region)))
+
+    def keep(self, rect):
+        # Regions under rect are requested ahead of time and protected from eviction
+        wanted = self.region_range(rect)
+        if wanted == self.wanted_list:
+            return
+        self.wanted_list = wanted
+        self.wanted = set(wanted)
+        for region in wanted:
+            self.request(region)
+
+
+class StreamedGround:
+    # Stands in for the baked ground ChunkedWorld when the map is streamed from region files
+    def __init__(self, store, margin=REGION_SIZE):
+        self.store = store
+        self.rect = store.rect
+        self.margin = margin  # How far past the camera regions are loaded ahead
+
+    def active_rect(self, camera_rect):
+        return camera_rect.inflate(self.margin * 2, self.margin * 2)
+
+    def invalidate(self, rect):
+        pass  # Region files are rebuilt from the source map when it changes
+
+    def draw(self, surface, camera_rect):
+        store = self.store
+        if store.requested:
+            store.pump()
+        store.keep(self.active_rect(camera_rect))
+        offset_x, offset_y = -camera_rect.x, -camera_rect.y
+        blits = []
+        for region in store.region_range(camera_rect):
+            x, y = store.region_topleft(region)
+            blits.append((store.get(region), (x + offset_x, y + offset_y)))
+        surface.blits(blits, doreturn=False)
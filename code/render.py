@@ -0,0 +1,117 @@
+import weakref
+
+import pygame
+
+try:
+    from pygame._sdl2 import video
+except ImportError:  # Not in every pygame build; the surface backend always works
+    video = None
+
+# Both backends take the Surface calls the draw code makes (blit, blits, fill, get_rect), so
+# LayeredWorld.draw, AllSprites.draw and the overlays draw onto either one unchanged.
+
+
+class SurfaceBackend:
+    # Software blits onto the display surface
+    name = 'surface'
+    partial_updates = True  # Can present just the rects that changed
+
+    def __init__(self, size, caption):
+        self.surface = pygame.display.set_mode(size)
+        pygame.display.set_caption(caption)
+
+    def get_rect(self):
+        return self.surface.get_rect()
+
+    def get_size(self):
+        return self.surface.get_size()
+
+    def fill(self, color, rect=None):
+        self.surface.fill(color, rect)
+
+    def blit(self, image, position):
+        self.surface.blit(image, position)
+
+    def blits(self, blits, doreturn=False):
+        self.surface.blits(blits, doreturn=False)
+
+    def set_clip(self, rect):
+        self.surface.set_clip(rect)
+
+    def forget(self, image):
+        pass
+
+    def present(self, rects=None):
+        if rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+
+
+class TextureBackend:
+    # Draws through an SDL Renderer. Each image is uploaded to a texture the first time it is drawn and
+    # copied from then on; SDL picks a GPU renderer when there is one and its software renderer otherwise.
+    # Textures are kept per Surface object until the surface is freed, so an image must not be drawn
+    # into once it has been drawn here: make a new one, or forget() the old one first.
+    name = 'texture'
+    partial_updates = False  # The back buffer is undefined after present(), so every frame is drawn whole
+
+    def __init__(self, size, caption):
+        if video is None:
+            raise RuntimeError("This pygame has no pygame._sdl2.video.")
+        # convert() still needs a display mode for its pixel format; the game draws into the window below
+        pygame.display.set_mode((1, 1), pygame.HIDDEN)
+        self.surface = None
+        self.window = video.Window(caption, size=size)
+        self.renderer = video.Renderer(self.window)
+        self.rect = pygame.Rect((0, 0), size)
+        self.textures = weakref.WeakKeyDictionary()
+
+    def get_rect(self):
+        return self.rect.copy()
+
+    def get_size(self):
+        return self.rect.size
+
+    def texture(self, image):
+        texture = self.textures.get(image)
+        if texture is None:
+            texture = self.textures[image] = video.Texture.from_surface(self.renderer, image)
+        return texture
+
+    def fill(self, color, rect=None):
+        renderer = self.renderer
+        renderer.draw_color = pygame.Color(color)
+        if rect is None:
+            renderer.clear()
+        else:
+            renderer.fill_rect(rect)
+
+    def blit(self, image, position):
+        # Only the top left of a position rect counts, as with Surface.blit
+        self.texture(image).draw(dstrect=(position[0], position[1]))
+
+    def blits(self, blits, doreturn=False):
+        textures = self.textures
+        for image, position in blits:
+            texture = textures.get(image)
+            if texture is None:
+                texture = self.texture(image)
+            texture.draw(dstrect=position)
+
+    def forget(self, image):
+        self.textures.pop(image, None)
+
+    def present(self, rects=None):
+        self.renderer.present()
+
+
+def create_backend(name, size, caption):
+    if name == 'texture':
+        try:
+            return TextureBackend(size, caption)
+        except (RuntimeError, pygame.error) as e:
+            print(f"Texture rendering unavailable, drawing with surfaces: {e}")
+    elif name != 'surface':
+        raise ValueError(f"Unknown render backend {name!r}.")
+    return SurfaceBackend(size, caption)
@@ -0,0 +1,178 @@
+import json
+import os
+
+import pygame
+from settings import TILE_SIZE
+from asset_cache import load_data
+from entities import Character, GifAnimation
+from npc_behaviors import PathBehavior, WanderBehavior
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENES_DIR = os.path.join(base_dir, 'scenes')
+BEHAVIORS = ('path', 'wander')
+
+
+def tile_to_pixels(tile, where):
+    if not (isinstance(tile, (list, tuple)) and len(tile) == 2 and all(isinstance(v, (int, float)) for v in tile)):
+        raise ValueError(f"{where}: expected [column, row], got {tile!r}")
+    return round(tile[0] * TILE_SIZE), round(tile[1] * TILE_SIZE)
+
+
+def compile_behavior(behavior, where):
+    kind = behavior.get('type')
+    if kind not in BEHAVIORS:
+        raise ValueError(f"{where}: behavior type must be one of {', '.join(BEHAVIORS)}")
+    if kind == 'path':
+        path = behavior.get('path') or []
+        if len(path) < 2:
+            raise ValueError(f"{where}: a path behavior needs at least two tiles")
+        return ('path', tuple(tile_to_pixels(tile, where) for tile in path), float(behavior.get('speed', 100)))
+    area = behavior.get('area')
+    if area is not None:
+        left, top = tile_to_pixels(area[:2], where)
+        right, bottom = tile_to_pixels(area[2:], where)
+        area = (left, top, right - left, bottom - top)
+    return ('wander', area, float(behavior.get('speed', 100)), float(behavior.get('interval', 3.0)))
+
+
+def compile_scene(source):
+    # Checks the whole scene up front and flattens it into marshal-friendly tuples bucketed by region,
+    # so loading a compiled scene is one unmarshal with nothing left to validate
+    region_size = source.get('region_size', 32) * TILE_SIZE
+    names = set()
+    always, regions = [], {}
+
+    def place(entry, position, persistent):
+        if persistent:
+            always.append(entry)
+        else:
+            regions.setdefault((position[0] // region_size, position[1] // region_size), []).append(entry)
+
+    for gif in source.get('gifs', []):
+        where = f"gif {gif.get('name', '?')}"
+        for key in ('name', 'path', 'size', 'tile'):
+            if key not in gif:
+                raise ValueError(f"{where}: missing '{key}'")
+        position = tile_to_pixels(gif['tile'], where)
+        place(('gif', gif['name'], gif['path'], tuple(gif['size']), position), position, gif.get('persistent', False))
+        names.add(gif['name'])
+
+    for character in source.get('characters', []):
+        where = f"character {character.get('name', '?')}"
+        for key in ('name', 'sheet', 'tile'):
+            if key not in character:
+                raise ValueError(f"{where}: missing '{key}'")
+        if character['name'] in names:
+            raise ValueError(f"{where}: the name is already used")
+        names.add(character['name'])
+        position = tile_to_pixels(character['tile'], where)
+        behavior = compile_behavior(character['behavior'], where) if 'behavior' in character else None
+        meeting = tile_to_pixels(character['meeting_tile'], where) if 'meeting_tile' in character else None
+        is_npc = bool(character.get('npc', False))
+        entry = ('character', character['name'], character['sheet'], position,
+                 tuple(character.get('dialogs', ())), is_npc, behavior, meeting)
+        # Playable characters have to exist from the start; NPCs wait for the camera
+        place(entry, position, character.get('persistent', not is_npc))
+
+    interns = tuple(source.get('interns', ()))
+    player = source.get('player', interns[0] if interns else None)
+    for name in interns + (player,):
+        if name not in names:
+            raise ValueError(f"Scene refers to unknown character {name!r}")
+    return {
+        'region_size': region_size,
+        'player': player,
+        'interns': interns,
+        'always': always,
+        'regions': regions,
+    }
+
+
+def load_scene(path):
+    def build():
+        with open(path, encoding='utf-8') as f:
+            return compile_scene(json.load(f))
+
+    return Scene(load_data(path, f'scene{TILE_SIZE}', build))
+
+
+class Scene:
+    def __init__(self, compiled, stream_margin=1):
+        self.region_size = compiled['region_size']
+        self.player = compiled['player']
+        self.interns = compiled['interns']
+        self.always = compiled['always']
+        self.regions = compiled['regions']
+        self.stream_margin = stream_margin  # Regions spawned ahead of the camera on every side
+        self.spawned = set()
+        self.last_range = None
+
+    def region_range(self, rect, margin):
+        size = self.region_size
+        return (range(rect.left // size - margin, (rect.right - 1) // size + margin + 1),
+                range(rect.top // size - margin, (rect.bottom - 1) // size + margin + 1))
+
+    def spawn(self, entry, game):
+        if entry[0] == 'gif':
+            _, name, path, size, position = entry
+            return name, GifAnimation(position, os.path.join(base_dir, 'assets', path), size, game.all_sprites)
+
+        _, name, sheet, position, dialogs, is_npc, behavior, meeting = entry
+        character = Character(position, game.overworld_frames['characters'][sheet], game.all_sprites,
+                              game.world_rect, list(dialogs), is_npc=is_npc)
+        character.collision_map = game.collision_map
+        character.pathfinder = game.pathfinder
+        character.set_timers(game.timers)
+        character.meeting_point = meeting
+        if behavior is not None:
+            if behavior[0] == 'path':
+                character.set_behavior(PathBehavior(list(behavior[1]), speed=behavior[2]))
+            else:
+                area = pygame.Rect(behavior[1]) if behavior[1] else None
+                character.set_behavior(WanderBehavior(behavior[3], area, behavior[2]))
+        return name, character
+
+    def spawn_always(self, game):
+        self.spawned.clear()
+        self.last_range = None
+        return dict(self.spawn(entry, game) for entry in self.always)
+
+    def restore(self, regions, game):
+        # Makes regions the spawned set again, as in a snapshot; spawns the entities of the ones not spawned yet
+        # and returns them. The caller removes the entities of regions spawned since.
+        regions = {tuple(region) for region in regions}
+        spawned = {}
+        for region in regions - self.spawned:
+            for entry in self.regions.get(region, ()):
+                name, entity = self.spawn(entry, game)
+                spawned[name] = entity
+        self.spawned = regions
+        self.last_range = None
+        return spawned
+
+    def stream(self, camera_rect, game):
+        # Spawns the entities of regions coming into range; returns what was spawned.
+        # Spawned regions stay, so this is a no-op until the camera crosses into a new region.
+        cols, rows = self.region_range(camera_rect, self.stream_margin)
+        if (cols, rows) == self.last_range:
+            return {}
+        self.last_range = (cols, rows)
+
+        spawned = {}
+        for row in rows:
+            for col in cols:
+                region = (col, row)
+                if region in self.spawned:
+                    continue
+                self.spawned.add(region)
+                for entry in self.regions.get(region, ()):
+                    name, entity = self.spawn(entry, game)
+                    spawned[name] = entity
+
+        # Sheets one region further out start loading now, so spawning them later doesn't hitch
+        characters = game.overworld_frames['characters']
+        if hasattr(characters, 'prefetch'):
+            cols, rows = self.region_range(camera_rect, self.stream_margin + 1)
+            characters.prefetch({entry[2] for row in rows for col in cols
+                                 for entry in self.regions.get((col, row), ()) if entry[0] == 'character'})
+        return spawned
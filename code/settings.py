@@ -3,8 +3,24 @@ from pygame.math import Vector2 as vector
 from sys import exit
 
 WINDOW_WIDTH, WINDOW_HEIGHT = 1280, 720
-TILE_SIZE = 64 
+TILE_SIZE = 32
 BATTLE_OUTLINE_WIDTH = 4
+RENDER_FPS = 60
+SIMULATION_DT = 1 / 60
+MAX_SIMULATION_STEPS = 5
+DOUBLE_TAP_TIME = 500  # Milliseconds of game time between presses of 1-3 that toggle stop_moving
+SPEECH_BUBBLE_TIMEOUT = None  # Milliseconds of game time a bubble stays up; None keeps it until R
+AMBIENT_NPCS = 0  # Crowd NPCs simulated in batch by crowd.py; needs numpy
+DIRTY_RECTS = False  # While the camera is still, redraw and present only what changed
+DIRTY_MAX_RECTS = 24  # Past either limit a full redraw is cheaper
+DIRTY_MAX_AREA = WINDOW_WIDTH * WINDOW_HEIGHT // 4
+RENDER_BACKEND = 'surface'  # 'texture' draws through an SDL2 Renderer instead, falling back to 'surface'
+WORLD_STREAMING = True  # Stream a flat map from cached region files instead of holding it decoded
+STUCK_TIME = 0.5  # Seconds a character can go without moving towards its target before it gives up or reroutes
+PRESENCE_SERVER = None  # 'host:port' of a presence.py server to share the office with; None plays alone
+PRESENCE_TICK_RATE = 20  # Updates a second, both ways
+PRESENCE_VIEW_MARGIN = 256  # Visitors are sent this far outside the camera, so they walk in already moving
+PRESENCE_INTERPOLATION_DELAY = 0.1  # Seconds remote visitors are drawn behind, two updates' worth
 
 COLORS = {
 	'white': '#f4fefa', 
@@ -0,0 +1,37 @@
+import marshal
+import os
+import struct
+import zlib
+
+SNAPSHOT_MAGIC = b'IHSS'
+SNAPSHOT_VERSION = 2
+SNAPSHOT_HEADER = struct.Struct('<4sH')
+
+
+def dumps(state):
+    return SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION) + zlib.compress(marshal.dumps(state), 6)
+
+
+def loads(data):
+    if len(data) < SNAPSHOT_HEADER.size:
+        raise ValueError("Truncated checkpoint.")
+    magic, version = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError("Unsupported checkpoint.")
+    try:
+        return marshal.loads(zlib.decompress(data[SNAPSHOT_HEADER.size:]))
+    except (EOFError, TypeError, zlib.error) as e:
+        raise ValueError(f"Corrupt checkpoint: {e}")
+
+
+def write_checkpoint(path, state):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(dumps(state))
+    os.replace(temp_path, path)
+
+
+def read_checkpoint(path):
+    with open(path, 'rb') as f:
+        return loads(f.read())
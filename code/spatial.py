@@ -0,0 +1,89 @@
+from settings import TILE_SIZE
+
+
+class SpatialGrid:
+    # Loose uniform grid: each sprite lives in the cell holding its rect center and
+    # queries are widened by the largest half-size seen, so a move is at most one relink
+    def __init__(self, cell_size=TILE_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.sprite_cells = {}
+        self.max_half_width = 0
+        self.max_half_height = 0
+
+    def __len__(self):
+        return len(self.sprite_cells)
+
+    def __contains__(self, sprite):
+        return sprite in self.sprite_cells
+
+    def cell_of(self, x, y):
+        return int(x) // self.cell_size, int(y) // self.cell_size
+
+    def insert(self, sprite):
+        rect = sprite.rect
+        self.max_half_width = max(self.max_half_width, (rect.width + 1) // 2)
+        self.max_half_height = max(self.max_half_height, (rect.height + 1) // 2)
+        cell = self.cell_of(*rect.center)
+        self.sprite_cells[sprite] = cell
+        self.cells.setdefault(cell, set()).add(sprite)
+
+    def remove(self, sprite):
+        cell = self.sprite_cells.pop(sprite, None)
+        if cell is None:
+            return
+        bucket = self.cells[cell]
+        bucket.discard(sprite)
+        if not bucket:
+            del self.cells[cell]
+
+    def update(self, sprite):
+        old_cell = self.sprite_cells.get(sprite)
+        if old_cell is None:
+            self.insert(sprite)
+            return
+        rect = sprite.rect
+        # Compared coordinate by coordinate so the common case, a sprite staying in its cell, builds no tuples
+        cell_size = self.cell_size
+        if rect.centerx // cell_size != old_cell[0] or rect.centery // cell_size != old_cell[1]:
+            self.remove(sprite)
+            self.insert(sprite)
+        elif rect.width > 2 * self.max_half_width or rect.height > 2 * self.max_half_height:
+            self.max_half_width = max(self.max_half_width, (rect.width + 1) // 2)
+            self.max_half_height = max(self.max_half_height, (rect.height + 1) // 2)
+
+    def candidates(self, left, top, right, bottom):
+        # Sprites whose center cell falls in the widened range; callers do the exact test
+        first_col, first_row = self.cell_of(left - self.max_half_width, top - self.max_half_height)
+        last_col, last_row = self.cell_of(right + self.max_half_width, bottom + self.max_half_height)
+
+        if (last_col - first_col + 1) * (last_row - first_row + 1) > len(self.cells):
+            # Large queries over a sparse grid are cheaper as a walk over the occupied cells
+            for (col, row), bucket in self.cells.items():
+                if first_col <= col <= last_col and first_row <= row <= last_row:
+                    yield from bucket
+            return
+
+        cells = self.cells
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                bucket = cells.get((col, row))
+                if bucket:
+                    yield from bucket
+
+    def query_rect(self, rect):
+        return [sprite for sprite in self.candidates(rect.left, rect.top, rect.right, rect.bottom)
+                if rect.colliderect(sprite.rect)]
+
+    def query_radius(self, center, radius):
+        x, y = center
+        radius_squared = radius * radius
+        found = []
+        for sprite in self.candidates(x - radius, y - radius, x + radius, y + radius):
+            rect = sprite.rect
+            # Distance from the center to the closest point of the sprite's rect
+            dx = max(rect.left - x, 0, x - rect.right)
+            dy = max(rect.top - y, 0, y - rect.bottom)
+            if dx * dx + dy * dy <= radius_squared:
+                found.append(sprite)
+        return found
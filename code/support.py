@@ -1,6 +1,8 @@
+from collections.abc import Mapping
 from settings import *
-from os.path import join
-from os import walk
+from os.path import join, splitext
+from os import walk, listdir
+from asset_cache import load_surfaces, forget, COLORKEY
 
 def import_image(*path, alpha = True, format = 'png'):
     full_path = join(*path) + f'.{format}'
@@ -33,33 +35,70 @@ def import_sub_folders(*path):
                 frames[sub_folder] = import_folder(*path, sub_folder)
     return frames
 
-def import_tilemap(cols, rows, *path):
-    frames = {}
+def slice_tilemap(cols, rows, *path):
+    frames = []
     surf = import_image(*path)
     cell_width, cell_height = surf.get_width() / cols, surf.get_height() / rows
     for col in range(cols):
         for row in range(rows):
             cutout_rect = pygame.Rect(col * cell_width, row * cell_height, cell_width, cell_height)
             cutout_surf = pygame.Surface((cell_width, cell_height))
-            cutout_surf.fill('green')
-            cutout_surf.set_colorkey('green')
+            cutout_surf.fill(COLORKEY)
+            cutout_surf.set_colorkey(COLORKEY, pygame.RLEACCEL)
             cutout_surf.blit(surf, (0,0), cutout_rect)
-            frames[(col, row)] = cutout_surf
-    return frames
+            frames.append(cutout_surf)
+    return frames, None
+
+def import_tilemap(cols, rows, *path):
+    surfaces, _ = load_surfaces(join(*path) + '.png', f'tilemap{cols}x{rows}',
+                                lambda: slice_tilemap(cols, rows, *path), colorkey=COLORKEY)
+    cells = [(col, row) for col in range(cols) for row in range(rows)]
+    return dict(zip(cells, surfaces))
+
+class CharacterFrames(dict):
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
 
 def character_importer(cols, rows, *path):
     frame_dict = import_tilemap(cols, rows, *path)
-    new_dict = {}
+    new_dict = CharacterFrames(path[-1])
     for row, direction in enumerate(('down','left','right','up')):
         new_dict[direction] = [frame_dict[(col, row)] for col in range(cols)]
         new_dict[f'{direction}_idle'] = [frame_dict[(0, row)]]
         
     return new_dict
 
+class LazyCharacterFrames(Mapping):
+    # Only the folder listing happens up front; a sheet is decoded the first time a character asks for it
+    def __init__(self, *path):
+        self.path = path
+        self.names = sorted(splitext(image)[0] for image in listdir(join(*path)) if image.endswith('.png'))
+        self.loaded = {}
+
+    def __getitem__(self, name):
+        frames = self.loaded.get(name)
+        if frames is None:
+            if name not in self.names:
+                raise KeyError(name)
+            frames = self.loaded[name] = character_importer(4, 4, *self.path, name)
+        return frames
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def prefetch(self, names):
+        for name in names:
+            if name in self.names:
+                self[name]
+
+    def evict(self, keep):
+        for name in [name for name in self.loaded if name not in keep]:
+            del self.loaded[name]
+            forget(join(*self.path, name) + '.png')
+
 def all_character_import(*path):
-    new_dict = {}
-    for _, _, image_names in walk(join(*path)):
-        for image in image_names:
-            image_name = image.split('.')[0]
-            new_dict[image_name] = character_importer(4, 4, *path, image_name)
-    return new_dict
\ No newline at end of file
+    return LazyCharacterFrames(*path)
\ No newline at end of file
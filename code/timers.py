@@ -0,0 +1,65 @@
+import heapq
+import itertools
+
+
+class Timer:
+    # Its own heap entry; timers due at the same time fire in the order they were set
+    __slots__ = ('due', 'order', 'callback', 'args')
+
+    def __init__(self, due, order, callback, args):
+        self.due = due
+        self.order = order
+        self.callback = callback
+        self.args = args
+
+    def __lt__(self, other):
+        return self.due < other.due or (self.due == other.due and self.order < other.order)
+
+    @property
+    def active(self):
+        return self.callback is not None
+
+    def cancel(self):
+        # Left in the heap and skipped when it comes due
+        self.callback = None
+        self.args = ()
+
+
+class Timers:
+    # Callbacks due at a time on the game clock, in milliseconds. The clock only moves when the game
+    # advances it, so timing follows the simulation steps rather than the wall clock, and a tick costs
+    # in proportion to the timers that fire rather than to the number of entities waiting on one.
+    def __init__(self):
+        self.now = 0.0
+        self.heap = []
+        self.order = itertools.count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def after(self, delay, callback, *args):
+        timer = Timer(self.now + delay, next(self.order), callback, args)
+        heapq.heappush(self.heap, timer)
+        return timer
+
+    def remaining(self, timer):
+        return max(timer.due - self.now, 0.0) if timer is not None and timer.active else None
+
+    def advance(self, elapsed):
+        end = self.now + elapsed
+        heap = self.heap
+        while heap and heap[0].due <= end:
+            timer = heapq.heappop(heap)
+            callback = timer.callback
+            if callback is None:
+                continue
+            # Run at the time it was due, so timers set from the callback don't drift with the step size
+            self.now = timer.due
+            timer.callback = None
+            callback(*timer.args)
+        self.now = end
+
+    def clear(self):
+        for timer in self.heap:
+            timer.cancel()
+        self.heap.clear()
@@ -0,0 +1,178 @@
+import os
+
+import pygame
+from settings import TILE_SIZE, WORLD_LAYERS
+
+CHUNK_SIZE = 512
+STATIC_LAYERS = ('water', 'bg', 'shadow')  # Baked together under everything
+SORTED_LAYER = 'main'  # Cut into strips that y-sort with the sprites
+OVERHEAD_LAYER = 'top'  # Baked separately and drawn over the sprites
+
+
+def load_world_layers(base_dir, world_image=None):
+    # One PNG per WORLD_LAYERS name in graphics/map/layers; the flat world.png stands in as bg when there are none
+    layers_dir = os.path.join(base_dir, 'assets', 'graphics', 'map', 'layers')
+    layers = {}
+    for name in sorted(WORLD_LAYERS, key=WORLD_LAYERS.get):
+        path = os.path.join(layers_dir, f'{name}.png')
+        if os.path.exists(path):
+            layers[name] = pygame.image.load(path).convert_alpha()
+    if not layers and world_image is not None:
+        layers['bg'] = world_image
+    return layers
+
+
+class ChunkedWorld:
+    def __init__(self, images, chunk_size=CHUNK_SIZE, opaque=True):
+        if isinstance(images, pygame.Surface):
+            images = [images]
+        self.images = list(images)
+        self.chunk_size = chunk_size
+        self.opaque = opaque
+        self.rect = self.images[0].get_rect()
+        self.cols = -(-self.rect.width // chunk_size)
+        self.rows = -(-self.rect.height // chunk_size)
+        self.chunks = {}
+        self.dirty = set()
+
+        # Cut the map into display-format tiles once so each frame only blits what the camera sees
+        for row in range(self.rows):
+            for col in range(self.cols):
+                self.bake(col, row)
+
+    def bake(self, col, row):
+        chunk_size = self.chunk_size
+        area = pygame.Rect(col * chunk_size, row * chunk_size, chunk_size, chunk_size).clip(self.rect)
+        if self.opaque:
+            chunk = pygame.Surface(area.size).convert()
+        else:
+            chunk = pygame.Surface(area.size, pygame.SRCALPHA).convert_alpha()
+        for image in self.images:
+            chunk.blit(image, (0, 0), area)
+        if not self.opaque and not chunk.get_bounding_rect().width:
+            # Nothing drawn on this part of an overlay layer
+            self.chunks[(col, row)] = None
+        else:
+            self.chunks[(col, row)] = (chunk, area.topleft)
+
+    def chunk_range(self, rect):
+        view = rect.clip(self.rect)
+        if not view.width or not view.height:
+            return range(0), range(0)
+        chunk_size = self.chunk_size
+        return (range(view.left // chunk_size, (view.right - 1) // chunk_size + 1),
+                range(view.top // chunk_size, (view.bottom - 1) // chunk_size + 1))
+
+    def invalidate(self, rect):
+        # The source images changed under rect; the chunks are rebaked the next time they are drawn
+        cols, rows = self.chunk_range(pygame.Rect(rect))
+        self.dirty.update((col, row) for row in rows for col in cols)
+
+    def visible_chunks(self, camera_rect):
+        cols, rows = self.chunk_range(camera_rect)
+        chunks = self.chunks
+        visible = []
+        for row in rows:
+            for col in cols:
+                if (col, row) in self.dirty:
+                    self.dirty.discard((col, row))
+                    self.bake(col, row)
+                chunk = chunks[(col, row)]
+                if chunk is not None:
+                    visible.append(chunk)
+        return visible
+
+    def draw(self, surface, camera_rect):
+        offset_x, offset_y = -camera_rect.x, -camera_rect.y
+        surface.blits([(chunk, (x + offset_x, y + offset_y)) for chunk, (x, y) in self.visible_chunks(camera_rect)],
+                      doreturn=False)
+
+
+class MapPiece:
+    # A strip of the main layer; AllSprites.draw sorts it by rect.bottom like any sprite
+    __slots__ = ('image', 'rect')
+
+    def __init__(self, image, rect):
+        self.image = image
+        self.rect = rect
+
+
+class SortedLayer:
+    def __init__(self, image, chunk_size=CHUNK_SIZE, strip_height=TILE_SIZE):
+        self.image = image
+        self.chunk_size = chunk_size
+        self.strip_height = strip_height
+        self.rect = image.get_rect()
+        self.cols = -(-self.rect.width // chunk_size)
+        self.rows = -(-self.rect.height // chunk_size)
+        self.pieces = {}
+        for row in range(self.rows):
+            for col in range(self.cols):
+                self.cut(col, row)
+
+    def cut(self, col, row):
+        # One piece per tile row of the chunk, cropped to what is actually drawn in it
+        chunk_size = self.chunk_size
+        area = pygame.Rect(col * chunk_size, row * chunk_size, chunk_size, chunk_size).clip(self.rect)
+        pieces = []
+        for top in range(area.top, area.bottom, self.strip_height):
+            strip = pygame.Rect(area.left, top, area.width, min(self.strip_height, area.bottom - top))
+            bounds = self.image.subsurface(strip).get_bounding_rect()
+            if not bounds.width:
+                continue
+            bounds.move_ip(strip.topleft)
+            # Sorting reads rect.bottom: use the bottom of the tile row rather than of the art,
+            # so every strip of a desk sorts by the row it stands on
+            rect = pygame.Rect(bounds.left, bounds.top, bounds.width, strip.bottom - bounds.top)
+            pieces.append(MapPiece(self.image.subsurface(bounds).copy(), rect))
+        self.pieces[(col, row)] = pieces
+
+    def invalidate(self, rect):
+        rect = pygame.Rect(rect).clip(self.rect)
+        chunk_size = self.chunk_size
+        for row in range(rect.top // chunk_size, (rect.bottom - 1) // chunk_size + 1):
+            for col in range(rect.left // chunk_size, (rect.right - 1) // chunk_size + 1):
+                self.cut(col, row)
+
+    def visible(self, camera_rect):
+        view = camera_rect.clip(self.rect)
+        if not view.width or not view.height:
+            return []
+        chunk_size = self.chunk_size
+        visible = []
+        for row in range(view.top // chunk_size, (view.bottom - 1) // chunk_size + 1):
+            for col in range(view.left // chunk_size, (view.right - 1) // chunk_size + 1):
+                visible.extend(piece for piece in self.pieces[(col, row)] if piece.rect.colliderect(view))
+        return visible
+
+
+class LayeredWorld:
+    def __init__(self, layers, chunk_size=CHUNK_SIZE, ground=None):
+        # ground replaces the baked static layers, e.g. with a regions.StreamedGround
+        self.layers = layers
+        if ground is None:
+            static = [layers[name] for name in STATIC_LAYERS if name in layers]
+            self.rect = next(iter(layers.values())).get_rect()
+            ground = ChunkedWorld(static or [pygame.Surface(self.rect.size)], chunk_size)
+        self.ground = ground
+        self.rect = ground.rect
+        self.main = SortedLayer(layers[SORTED_LAYER], chunk_size) if SORTED_LAYER in layers else None
+        self.top = ChunkedWorld(layers[OVERHEAD_LAYER], chunk_size, opaque=False) if OVERHEAD_LAYER in layers else None
+
+    def invalidate(self, rect):
+        # Call after drawing into one of self.layers; only the chunks under rect are rebuilt
+        self.ground.invalidate(rect)
+        if self.main:
+            self.main.invalidate(rect)
+        if self.top:
+            self.top.invalidate(rect)
+
+    def visible_pieces(self, camera_rect):
+        return self.main.visible(camera_rect) if self.main else []
+
+    def draw(self, surface, camera_rect):
+        self.ground.draw(surface, camera_rect)
+
+    def draw_top(self, surface, camera_rect):
+        if self.top:
+            self.top.draw(surface, camera_rect)